@@ -0,0 +1,109 @@
+#!/usr/bin/env -S uv run --script
+"""Micro-benchmark: parsing LibGen result pages, html.parser vs. lxml."""
+import argparse
+import logging
+import random
+import timeit
+import typing as t
+from dataclasses import asdict
+from pathlib import Path
+
+import bs4  # type: ignore[import-untyped]
+import bs4.builder  # type: ignore[import-untyped]
+
+from lgdl import LibgenDownload
+
+
+class Bench(LibgenDownload):
+    """Parse result pages that `lgdl --debug` saved (`lgdl-query-HOST.html`)."""
+
+    def parse_args(self) -> None:
+        """Parse command line."""
+        parser = argparse.ArgumentParser(description=self.__class__.__doc__)
+        parser.add_argument(
+            "pages",
+            metavar="PAGE",
+            nargs="+",
+            type=Path,
+            help="Saved v1 (libgen.gs) or v2 (libgen.is) result page",
+        )
+        parser.add_argument(
+            "-r",
+            "--repeat",
+            type=int,
+            default=5,
+            help="Number of times to repeat each measurement",
+        )
+        self.args = parser.parse_args()
+        # What `get_raw_hits()` needs of an lgdl command line
+        self.args.debug = False
+        self.args.max_stem = 80
+        self.args.output = Path("libgen")
+        self.args.overwrite = False
+
+    @staticmethod
+    def host(page: Path) -> str:
+        """Which host a dump came from, going by its name."""
+        prefix = "lgdl-query-"
+        if page.stem.startswith(prefix):
+            return page.stem.removeprefix(prefix)
+        return "libgen.gs"
+
+    def hits(
+        self,
+        html: str,
+        host: str,
+        parser: str,
+        parse_only: bs4.SoupStrainer | None,
+    ) -> list[dict[str, t.Any]]:
+        """Parse a page one way."""
+        self.PARSER = parser
+        self.QUERY_ONLY = parse_only
+        random.seed(0)  # `parse_row()` shuffles mirrors
+        return [asdict(hit) for hit in self.get_raw_hits(html, host)]
+
+    def measure(
+        self,
+        html: str,
+        host: str,
+        parser: str,
+        parse_only: bs4.SoupStrainer | None,
+    ) -> list[dict[str, t.Any]]:
+        """Time one way of parsing a page."""
+        best = min(
+            timeit.repeat(
+                lambda: self.hits(html, host, parser, parse_only),
+                number=1,
+                repeat=self.args.repeat,
+            ),
+        )
+        name = f"{parser}{', strained' if parse_only else ''}"
+        print(f"  {name:24}  {best * 1000:8.1f} ms")
+        return self.hits(html, host, parser, parse_only)
+
+    def main(self) -> None:
+        """Script entry point."""
+        self.parse_args()
+        self.log = logging.getLogger("bench")
+        parsers = ["html.parser"]
+        if bs4.builder.builder_registry.lookup("lxml"):
+            parsers.append("lxml")
+        for page in self.args.pages:
+            html = page.read_text(encoding="utf-8")
+            host = self.host(page)
+            print(f"{page.name} ({host}), best of {self.args.repeat}")
+            old = self.measure(html, host, "html.parser", None)
+            for parser in parsers:
+                for parse_only in [None, LibgenDownload.QUERY_ONLY]:
+                    if parser == "html.parser" and parse_only is None:
+                        continue
+                    assert self.measure(html, host, parser, parse_only) == old
+            print(f"  {len(old)} hit(s)")
+
+
+if __name__ == "__main__":
+    Bench().main()
+
+# /// script
+# dependencies = ["beautifulsoup4", "lxml", "requests", "rich", "simple-term-menu"]
+# ///
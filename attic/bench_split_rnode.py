@@ -0,0 +1,133 @@
+#!/usr/bin/env -S uv run --script
+"""Micro-benchmark: splitting formula runs, deepcopy vs. `split_rnode`."""
+import argparse
+import re
+import tempfile
+import timeit
+import typing as t
+import zipfile as zf
+from copy import deepcopy
+from pathlib import Path
+
+from lxml import etree
+
+from docx_worker import DocxWorker
+from proof import Proof
+
+
+class Bench(DocxWorker):
+    """Run `split_rnode` on a synthetic formula-dense document."""
+
+    args: argparse.Namespace
+    tmp_dir: tempfile.TemporaryDirectory
+
+    def parse_args(self) -> None:
+        """Parse command line."""
+        parser = argparse.ArgumentParser(description=self.__class__.__doc__)
+        parser.add_argument(
+            "-n",
+            "--runs",
+            type=int,
+            default=20_000,
+            help="Number of formula runs in the synthetic document",
+        )
+        parser.add_argument(
+            "-r",
+            "--repeat",
+            type=int,
+            default=3,
+            help="Number of times to repeat each measurement",
+        )
+        self.args = parser.parse_args()
+
+    def pre_work(self) -> Path:
+        """Return path to a synthetic .docx."""
+        self.parse_args()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        path = Path(self.tmp_dir.name) / "bench.docx"
+        with zf.ZipFile(path, "w") as ozip:
+            ozip.writestr(
+                f"{self.WORD_FOLDER}/{self.MAIN_STEM}.xml", self.synthesize(),
+            )
+        return path
+
+    def work(self) -> None:
+        """Time both approaches, and check they agree."""
+        print(f"Splitting {self.args.runs} runs, best of {self.args.repeat}")
+        old = self.measure("deepcopy", self.split_by_deepcopy)
+        new = self.measure("template", self.split_by_template)
+        assert old == new
+
+    def post_work(self) -> None:
+        """Remove the synthetic .docx."""
+        self.tmp_dir.cleanup()
+
+    def synthesize(self) -> str:
+        """Create a document with many partially-italicizable runs."""
+        rpr = (
+            '<w:rPr><w:rStyle w:val="Formula"/><w:rFonts w:ascii="Cambria"'
+            ' w:hAnsi="Cambria" w:cs="David"/><w:sz w:val="24"/>'
+            '<w:szCs w:val="24"/><w:lang w:val="en-US" w:bidi="he-IL"/></w:rPr>'
+        )
+        run = f"<w:r>{rpr}<w:t>f(x) = ax + b, P(A|B) = 0.5 n</w:t></w:r>"
+        paras = "".join(
+            f"<w:p>{run * 4}</w:p>" for _ in range(self.args.runs // 4)
+        )
+        return (
+            f'<w:document xmlns:w="{self._W}"><w:body>{paras}</w:body>'
+            f"</w:document>"
+        )
+
+    def pieces(self, text: str) -> list[tuple[str, str | None]]:
+        """Split text like `Proof._italicize_math` does."""
+        pieces: list[tuple[str, str | None]] = []
+        idx_prev = 0
+        for match in re.finditer(Proof.ITALICABLE_RE, text):
+            (idx_from, idx_to) = match.span()
+            if idx_prev < idx_from:
+                pieces.append((text[idx_prev:idx_from], None))
+            pieces.append((text[idx_from:idx_to], "i"))
+            idx_prev = idx_to
+        if idx_prev < len(text):
+            pieces.append((text[idx_prev:], None))
+        return pieces
+
+    def split_by_deepcopy(self, rnode: etree._Entity) -> None:
+        """Split the old way: deepcopy the whole run per piece."""
+        for text, extra_tag in self.pieces(self.find(rnode, "w:t").text):
+            addend = deepcopy(rnode)
+            tnode = self.find(addend, "w:t")
+            tnode.text = text
+            if text[0].isspace() or text[-1].isspace():
+                tnode.set(self.XML_SPACE, "preserve")
+            if extra_tag is not None:
+                self.find(addend, "w:rPr").append(self.make_w(extra_tag))
+            rnode.addprevious(addend)
+        rnode.getparent().remove(rnode)
+
+    def split_by_template(self, rnode: etree._Entity) -> None:
+        """Split the new way."""
+        self.split_rnode(rnode, self.pieces(self.find(rnode, "w:t").text))
+
+    def measure(self, name: str, split: t.Callable) -> bytes:
+        """Time one approach on fresh copies of the document."""
+        original = self.docs[self.MAIN_STEM]
+        best = float("inf")
+        for _ in range(self.args.repeat):
+            self.doc = deepcopy(original)
+            rnodes = list(self.xpath(self.doc, "//w:r"))
+            seconds = timeit.timeit(
+                lambda: [split(rnode) for rnode in rnodes],  # noqa: B023
+                number=1,
+            )
+            best = min(best, seconds)
+        print(f"{name:10}  {best * 1000:8.1f} ms")
+        return etree.tostring(self.doc)
+
+
+if __name__ == "__main__":
+    Bench().main()
+
+# /// script
+# dependencies = ["lxml"]
+# ///
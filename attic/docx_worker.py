@@ -6,6 +6,8 @@ import zipfile as zf
 from collections import Counter
 from collections.abc import Callable
 from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from pathlib import Path
 from pathlib import PurePosixPath
 
@@ -142,6 +144,41 @@ class DocxWorker(abc.ABC):
             with self.izip.open(info, "r") as ifo:
                 ofo.write(ifo.read())
 
+    def write_variants(self, variants: dict[Path, bytes]) -> None:
+        """Write several copies of the open docx, each with its own main doc.
+
+        Everything but the main document is read (or serialized) only once
+        and shared by all copies, which are written concurrently; zlib
+        releases the GIL, so compression really does run in parallel.
+        """
+        shared: dict[str, bytes] = {}
+        main_name = None
+        for info in self.izip.infolist():
+            path = PurePosixPath(info.filename)
+            if str(path.parent) != self.WORD_FOLDER or path.stem not in self.docs:
+                shared[info.filename] = self.izip.read(info)
+            elif path.stem == self.MAIN_STEM:
+                main_name = info.filename
+            else:
+                shared[info.filename] = etree.tostring(self.docs[path.stem])
+        assert main_name is not None
+
+        with ThreadPoolExecutor() as executor:
+            futures = [
+                executor.submit(
+                    self._write_prepared, output_path, {**shared, main_name: main},
+                )
+                for output_path, main in variants.items()
+            ]
+            for future in futures:
+                future.result()
+
+    def _write_prepared(self, output_path: Path, entries: dict[str, bytes]) -> None:
+        """Write a docx from prepared entries, in the input's order."""
+        with zf.ZipFile(output_path, "w", compression=zf.ZIP_DEFLATED) as ozip:
+            for info in self.izip.infolist():
+                ozip.writestr(info.filename, entries[info.filename])
+
     @classmethod
     def iter_counter(cls, counter: CounterLike) -> Iterable[tuple[str, int]]:
         """Tterate a Counter object."""
@@ -182,6 +219,89 @@ class DocxWorker(abc.ABC):
             attrib = {self.wtag(key): val for key, val in attrib.items()}
         return self.doc.getroot().makeelement(self.wtag(tag), attrib=attrib)
 
+    XML_SPACE = "{http://www.w3.org/XML/1998/namespace}space"
+
+    def split_rnode(
+        self,
+        rnode: etree._Entity,
+        pieces: Iterable[tuple[str, str | None]],
+    ) -> list[etree._Entity]:
+        """Replace a <w:r> node with several, one per (text, extra_tag).
+
+        Instead of deep-copying the whole run for every piece, the <w:rPr>
+        is built once per distinct `extra_tag` (e.g., "i") and only that
+        template is copied.  The new runs hold only <w:rPr> and <w:t>,
+        and are spliced into the parent in one go.  Runs with anything
+        else (<w:tab>, <w:br>, <w:sym>, ...) are deep-copied per piece,
+        as before, so none of it is lost.
+        """
+        rprops = self.find(rnode, "w:rPr")
+        tnode = self.find(rnode, "w:t")
+        t_tag = self.wtag("t")
+        if [child.tag for child in rnode if child is not rprops] == [t_tag]:
+            fragments = self._template_fragments(rnode, rprops, tnode, pieces)
+        else:
+            fragments = [
+                self._copied_fragment(rnode, text, extra_tag)
+                for text, extra_tag in pieces
+            ]
+
+        parent = rnode.getparent()
+        idx = parent.index(rnode)
+        parent[idx:idx + 1] = fragments
+        return fragments
+
+    def _template_fragments(
+        self,
+        rnode: etree._Entity,
+        rprops: etree._Entity | None,
+        tnode: etree._Entity,
+        pieces: Iterable[tuple[str, str | None]],
+    ) -> list[etree._Entity]:
+        """Build <w:r> nodes from `rprops` templates and fresh <w:t> nodes."""
+        t_attrib = dict(tnode.attrib)
+        t_tag = self.wtag("t")
+        templates: dict[str | None, etree._Entity | None] = {None: rprops}
+
+        fragments = []
+        for text, extra_tag in pieces:
+            if extra_tag not in templates:
+                template = (
+                    self.make_w("rPr") if rprops is None else deepcopy(rprops)
+                )
+                template.append(self.make_w(extra_tag))
+                templates[extra_tag] = template
+            fragment = rnode.makeelement(rnode.tag, attrib=rnode.attrib)
+            if (template := templates[extra_tag]) is not None:
+                fragment.append(deepcopy(template))
+            piece_tnode = etree.SubElement(fragment, t_tag, attrib=t_attrib)
+            self._set_text(piece_tnode, text)
+            fragments.append(fragment)
+        return fragments
+
+    def _copied_fragment(
+        self,
+        rnode: etree._Entity,
+        text: str,
+        extra_tag: str | None,
+    ) -> etree._Entity:
+        """Deep-copy a <w:r> node, with different text (in its first <w:t>)."""
+        fragment = deepcopy(rnode)
+        self._set_text(self.find(fragment, "w:t"), text)
+        if extra_tag is not None:
+            rprops = self.find(fragment, "w:rPr")
+            if rprops is None:
+                rprops = self.make_w("rPr")
+                fragment.insert(0, rprops)
+            rprops.append(self.make_w(extra_tag))
+        return fragment
+
+    def _set_text(self, tnode: etree._Entity, text: str) -> None:
+        """Set the text of a <w:t> node, keeping edge spaces if any."""
+        tnode.text = text
+        if text and (text[0].isspace() or text[-1].isspace()):
+            tnode.set(self.XML_SPACE, "preserve")
+
     R_XPATH = "w:r | w:ins/w:r | w:hyperlink/w:r"
     RT_XPATH = f"({R_XPATH})/w:t"
 
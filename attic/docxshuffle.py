@@ -21,7 +21,7 @@ class DocxShuffle(DocxWorker):
     args: argparse.Namespace
     body: etree._Entity
     rng: np.random.Generator
-    l2ps: dict[str, etree._Entity]
+    l2is: dict[str, list[int]]  # Line -> indices into `meat_pnodes`
     meat_pnodes: list[etree._Entity]
     seed_path: Path
 
@@ -133,46 +133,42 @@ class DocxShuffle(DocxWorker):
         self.body = self.find(self.doc, "./w:body")
         self.parse_text()
 
-        new_pnodes = [random.choice(pnodes) for pnodes in self.l2ps.values()]
-        self.rng.shuffle(new_pnodes)
-        self.reorder(new_pnodes)
-        self.write_as("shuffled")
-
-        self.make_rerunner()
-
-        self.reorder(
-            [
-                pnode
-                for _, pnodes in sorted(self.l2ps.items())
-                for pnode in pnodes
+        orderings = {
+            "shuffled": self.shuffled_ordering(),
+            "sorted": [
+                idx for _, idxs in sorted(self.l2is.items()) for idx in idxs
             ],
-        )
-        self.write_as("sorted")
-
-        self.reorder(
-            [
-                pnode
-                for _, pnodes in sorted(
-                    self.l2ps.items(),
+            "detros": [
+                idx
+                for _, idxs in sorted(
+                    self.l2is.items(),
                     key=lambda item: "".join(reversed(item[0])),
                 )
-                for pnode in pnodes
+                for idx in idxs
             ],
-        )
-        self.write_as("detros")
-
-        self.reorder(
-            [
-                pnodes[0]
-                for _, pnodes in sorted(
-                    self.l2ps.items(), key=lambda i: len(i[0]),
+            "growing": [
+                idxs[0]
+                for _, idxs in sorted(
+                    self.l2is.items(), key=lambda i: len(i[0]),
                 )
             ],
-        )
-        self.write_as("growing")
+        }
+        if (msort := self.model_ordering()) is not None:
+            orderings["msort"] = msort
 
+        self.make_rerunner()
+        self.write_orderings(orderings)
+
+    def shuffled_ordering(self) -> list[int]:
+        """Pick one paragraph per unique line, and shuffle them."""
+        new_idxs = [random.choice(idxs) for idxs in self.l2is.values()]
+        self.rng.shuffle(new_idxs)
+        return new_idxs
+
+    def model_ordering(self) -> list[int] | None:
+        """Order the paragraphs like the lines of the model file, if any."""
         if not self.args.model:
-            return
+            return None
 
         with self.args.model.open("r", encoding="utf-8") as mfo:
             model_lines = []
@@ -183,12 +179,9 @@ class DocxShuffle(DocxWorker):
                     model_lines.append(line)
         if (n_model := len(model_lines)) != (n_meat := len(self.meat_pnodes)):
             print(f"Cannot use model (n={n_model}) to sort text (n={n_meat})")
-            return
+            return None
 
-        self.reorder([
-            self.meat_pnodes[idx] for idx in np.argsort(model_lines)
-        ])
-        self.write_as("msort")
+        return [int(idx) for idx in np.argsort(model_lines)]
 
     def parse_text(self) -> None:
         """Read and normalize the contexts of the .docx file."""
@@ -202,7 +195,7 @@ class DocxShuffle(DocxWorker):
         elif self.args.restyle:
             self.restyle()
 
-        self.l2ps = defaultdict(list)
+        self.l2is = defaultdict(list)
         for pnode in pnodes:
             text = "".join(tnode.text for tnode in self.pnode_tnodes(pnode))
             if len(text) < self.args.min_length:
@@ -216,11 +209,11 @@ class DocxShuffle(DocxWorker):
             meat = re.sub(r"[^א-תa-zA-Z]", "", text)
             if not meat:
                 continue
-            self.l2ps[meat].append(pnode)
+            self.l2is[meat].append(len(self.meat_pnodes))
             self.meat_pnodes.append(pnode)
             num_pnodes += 1
 
-        print(f"Number of unique lines: {len(self.l2ps)} of {num_pnodes}")
+        print(f"Number of unique lines: {len(self.l2is)} of {num_pnodes}")
 
     def color_background(self) -> None:
         """Change paper color in the shuffled files."""
@@ -281,17 +274,37 @@ class DocxShuffle(DocxWorker):
         with self.seed_path.open("wb") as fobj:
             pickle.dump(self.rng, fobj)
 
-    def reorder(self, pnodes: list[etree._Entity]) -> None:
-        """Replace paragraphs with new order."""
+    SPLIT_MARK = "docxshuffle-split"
+
+    def serialize_pnodes(self) -> tuple[bytes, list[bytes], bytes]:
+        """Serialize the document once, split around each meat paragraph.
+
+        Returns the bytes before the paragraphs, those of each paragraph
+        (in `meat_pnodes` order) and the bytes after them.  Like the
+        documents we used to write, all other paragraphs are dropped and
+        the meat goes at the end of the body.
+        """
         for pnode in list(self.xpath(self.body, "./w:p")):
             self.body.remove(pnode)
-        self.body.extend(pnodes)
-
-    def write_as(self, suffix: str) -> None:
-        """Write a version of the file."""
-        path = self.args.input.with_stem(f"{self.args.stem}-{suffix}")
-        print(f"Writing {path}")
-        self.write(path)
+        for pnode in self.meat_pnodes:
+            self.body.append(etree.Comment(self.SPLIT_MARK))
+            self.body.append(pnode)
+        self.body.append(etree.Comment(self.SPLIT_MARK))
+
+        mark = etree.tostring(etree.Comment(self.SPLIT_MARK))
+        (head, *parts, tail) = etree.tostring(self.doc).split(mark)
+        assert len(parts) == len(self.meat_pnodes)
+        return head, parts, tail
+
+    def write_orderings(self, orderings: dict[str, list[int]]) -> None:
+        """Write a version of the file per paragraph ordering."""
+        (head, parts, tail) = self.serialize_pnodes()
+        variants = {}
+        for suffix, idxs in orderings.items():
+            path = self.args.input.with_stem(f"{self.args.stem}-{suffix}")
+            print(f"Writing {path}")
+            variants[path] = b"".join([head, *(parts[idx] for idx in idxs), tail])
+        self.write_variants(variants)
 
     def make_rerunner(self) -> None:
         """Create rerunner script."""
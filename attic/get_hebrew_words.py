@@ -1,20 +1,29 @@
 #!/usr/bin/env -S uv run --script
 """Based on code from https://github.com/fab-jul/parse_dictionaries."""
 
-import itertools
 import json
+import mmap
+import multiprocessing.pool
+import os
+import typing as t
 import zlib
 from pathlib import Path
 
 import regex as re  # ty: ignore[unresolved-import]
 from lxml import etree  # ty: ignore[unresolved-import]
 
+from hebrew_lexicon import HebrewLexicon
+
+if t.TYPE_CHECKING:
+    from collections.abc import Iterator
+
 ROOT = Path(
     "/System/Library/AssetsV2"
     "/com_apple_MobileAsset_DictionaryServices_dictionaryOSX",
 )
-JSON = Path("hebrew.json")
+JSONL = Path("hebrew.jsonl")
 WRDS = Path("hebrew.words")
+LXCN = WRDS.with_suffix(".lexicon")
 TXTS = Path("hebrew.texts")
 
 _NIQQ = "\u05B0-\u05BC\u05C1\u05C2"
@@ -28,47 +37,58 @@ NIQQ_RE = re.compile(f"[{_NIQQ}]")
 BRACKETS_RE = re.compile(r"\[[^\]]+:[^\]]*?\]")
 
 
-def main() -> None:
-    """Get Hebrew words."""
-    if JSON.is_file():
-        print("Reading parsed dictionary...")
-        with JSON.open(encoding="utf8") as fobj:
-            entries = json.load(fobj)
-    else:
-        body = next(ROOT.glob("**/Hebrew.dictionary/Contents/Resources/Body.data"))
-        print(f"Parsing {body}...")
-        entries = _parse(body)
-        with JSON.open("w", encoding="utf8") as fobj:
-            json.dump(entries, fobj, ensure_ascii=False)
-    print(f"Number of entries: {len(entries)}")
-
-    with TXTS.open("w", encoding="utf8") as fobj:
-        words = {}
-        for key, xml in entries:
-            node = etree.fromstring(xml)
+type Entry = tuple[str, str]  # Key, definition
+
+FIRST_BLOCK_OFFSET = 100  # The first zip file starts at ~100 bytes
+ZLIB_CMF = 0x78  # Deflate, 32K window; the first byte of every zlib block
+READ_CHUNK = 1 << 16
+POOL_CHUNK = 8  # Blocks per worker task
+POOL_BATCH = 256  # Inflated blocks handed to the pool at once, to bound memory
+STOP_MARK = "fbm_AdvisoryBoard"  # In the meta info after the last entry
+
+
+class Extracted(t.NamedTuple):
+    """What we want from some dictionary entries."""
 
-            for label in node.xpath("//span[contains(@class, 'ty_label')]"):
-                label.getparent().remove(label)
+    texts: list[str]
+    words: list[tuple[str, str]]  # (word, key), first occurrence only
+    bad: str | None  # Text of an entry we choked on, if any
 
-            bext = etree.tostring(node, encoding="utf-8", method="text")
-            text = bext.decode("utf-8")
 
-            fobj.write(text)
-            fobj.write("\n\n")
+class Inflated(t.NamedTuple):
+    """A zlib block of Body.data, decompressed."""
 
-            if "[" in text:
-                text = BRACKETS_RE.sub("", text)
+    end: int  # Offset after this block
+    data: bytes
+    first: bool  # Whether this is the first block parsed (to be verbose about)
 
-            kord = ZVOR_RE.sub("", key)
-            for tord in WORD_RE.findall(f"{kord} {text}"):
-                if not NIQQ_RE.search(tord):
-                    continue
-                if tord.startswith("אְ"):
-                    print(text)
-                    return
-                nztord = ZVOR_RE.sub("", tord)
-                words.setdefault(nztord, kord)
 
+class Block(t.NamedTuple):
+    """A zlib block of Body.data, after being worked on."""
+
+    end: int  # Offset after this block
+    entries: list[Entry]
+    extracted: Extracted
+    stop: bool  # Whether this is the last block with entries
+
+
+def main() -> None:
+    """Get Hebrew words."""
+    n_entries = 0
+    with multiprocessing.Pool() as pool, TXTS.open("w", encoding="utf8") as fobj:
+        words = {}
+        for extracted in _extracted(pool):
+            n_entries += len(extracted.texts)
+            for text in extracted.texts:
+                fobj.write(text)
+                fobj.write("\n\n")
+            if extracted.bad is not None:
+                print(extracted.bad)
+                return
+            for word, key in extracted.words:
+                words.setdefault(word, key)
+
+    print(f"Number of entries: {n_entries}")
     print(f"Number of words: {len(words)}")
     with WRDS.open("w", encoding="utf8") as fobj:
         for word, key in sorted(words.items()):
@@ -76,75 +96,207 @@ def main() -> None:
             fobj.write("\t")
             fobj.write(key)
             fobj.write("\n")
+    print(f"Writing {LXCN}")
+    HebrewLexicon.build(LXCN, words)
 
 
-def _parse(dictionary_path: Path) -> list[tuple[str, str]]:
-    """Parse Body.data into a list of entries given as key, definition tuples."""
-    with dictionary_path.open("rb") as fobj:
-        content_bytes = fobj.read()
-    total_bytes = len(content_bytes)
+def _extracted(pool: multiprocessing.pool.Pool) -> Iterator[Extracted]:
+    """Work on the cached and/or parsed dictionary, yielding results in order.
 
-    # The first zip file starts at ~100 bytes:
-    content_bytes = content_bytes[100:]
-
-    first = True
-    entries = []
-    for i in itertools.count():
-        if not content_bytes:  # Backup condition in case stop is never True.
-            break
-        try:
-            dec = zlib.decompressobj()
-            res = dec.decompress(content_bytes)
-            new_entries, stop = _split(res, verbose=first)
-            entries += new_entries
-            if stop:
+    The cache is JSON lines: `[key, definition]` per entry, and after each
+    zlib block `{"resume_at": offset}` (`null` once the parse is complete).
+    An interrupted parse resumes from the last such checkpoint.
+    """
+    resume_at: int | None = FIRST_BLOCK_OFFSET
+    if JSONL.is_file():
+        print("Reading parsed dictionary...")
+        resume_at = _check_cache()
+        yield from pool.imap(_extract, _read_cache(), chunksize=POOL_CHUNK)
+        if resume_at is None:
+            return
+
+    body = next(ROOT.glob("**/Hebrew.dictionary/Contents/Resources/Body.data"))
+    print(f"Parsing {body} from offset {resume_at}...")
+
+    total_bytes = body.stat().st_size
+    n_entries = 0
+    with JSONL.open("a", encoding="utf8") as fobj:
+        for i, block in enumerate(_worked_blocks(pool, body, resume_at)):
+            for entry in block.entries:
+                fobj.write(json.dumps(entry, ensure_ascii=False))
+                fobj.write("\n")
+            fobj.write(json.dumps({"resume_at": block.end}))
+            fobj.write("\n")
+            fobj.flush()
+            yield block.extracted
+            if block.stop:
                 break
-            if i % 10 == 0:
-                bytes_left = len(content_bytes)  # Approximately...
-                progress = 1 - bytes_left / total_bytes
+
+            n_entries += len(block.entries)
+            if i % 10 == 0 and block.entries:
                 print(
-                    f"{progress * 100:.1f}% // "
-                    f"{len(entries)} entries parsed // "
-                    f"Latest entry: {entries[-1][0]}",
+                    f"{block.end / total_bytes * 100:.1f}% // "
+                    f"{n_entries} entries parsed // "
+                    f"Latest entry: {block.entries[-1][0]}",
                 )
-            first = False
-
-            # Set content_bytes to the unused data so we can start the search for the
-            # next zip file.
-            content_bytes = dec.unused_data
-
-        except zlib.error:  # Current content_bytes is not a zipfile -> skip a byte.
-            content_bytes = content_bytes[1:]
-
-    return entries
-
-
-def _split(input_bytes: bytes, *, verbose: bool) -> tuple[list[tuple[str, str]], bool]:
+        fobj.write(json.dumps({"resume_at": None}))
+        fobj.write("\n")
+
+
+def _check_cache() -> int | None:
+    """Truncate the cache after its last checkpoint; return that checkpoint.
+
+    Entries after the last checkpoint belong to a block that was cut short,
+    and parsing resumes by appending.  Returns None if the parse is complete.
+    """
+    resume_at: int | None = FIRST_BLOCK_OFFSET
+    committed = 0
+    with JSONL.open("rb") as fobj:
+        for line in fobj:
+            if line.startswith(b"{") and line.endswith(b"\n"):
+                resume_at = json.loads(line)["resume_at"]
+                committed = fobj.tell()
+
+    if resume_at is not None:
+        os.truncate(JSONL, committed)
+    return resume_at
+
+
+def _read_cache() -> Iterator[list[Entry]]:
+    """Yield cached entries, one list per block (assumes `_check_cache`)."""
+    entries: list[Entry] = []
+    with JSONL.open("rb") as fobj:
+        for line in fobj:
+            if line.startswith(b"{"):
+                yield entries
+                entries = []
+            else:
+                entries.append(tuple(json.loads(line)))
+
+
+def _extract(entries: list[Entry]) -> Extracted:
+    """Extract text and words from entries (in a worker process)."""
+    texts = []
+    words = {}
+    for key, xml in entries:
+        node = etree.fromstring(xml)
+
+        for label in node.xpath("//span[contains(@class, 'ty_label')]"):
+            label.getparent().remove(label)
+
+        bext = etree.tostring(node, encoding="utf-8", method="text")
+        text = bext.decode("utf-8")
+        texts.append(text)
+
+        if "[" in text:
+            text = BRACKETS_RE.sub("", text)
+
+        kord = ZVOR_RE.sub("", key)
+        for tord in WORD_RE.findall(f"{kord} {text}"):
+            if not NIQQ_RE.search(tord):
+                continue
+            if tord.startswith("אְ"):
+                return Extracted(texts, list(words.items()), bad=text)
+            nztord = ZVOR_RE.sub("", tord)
+            words.setdefault(nztord, kord)
+    return Extracted(texts, list(words.items()), bad=None)
+
+
+def _worked_blocks(
+    pool: multiprocessing.pool.Pool,
+    dictionary_path: Path,
+    start: int,
+) -> Iterator[Block]:
+    """Yield the blocks of a file from `start` on, worked on in `pool`, in order.
+
+    Blocks are inflated here, once: that's how their ends are found.  The
+    workers get the decompressed data, POOL_BATCH blocks at a time.  A
+    batch also ends at a block with STOP_MARK in it, and nothing more is
+    sent unless that block turns out not to be the last: what comes after
+    it isn't entries, and would fail a worker's whole chunk.
+    """
+    batch: list[Inflated] = []
+    for inflated in _inflate_blocks(dictionary_path, start):
+        batch.append(inflated)
+        if len(batch) < POOL_BATCH and STOP_MARK.encode() not in inflated.data:
+            continue
+        for block in pool.imap(_work_on_block, batch, chunksize=POOL_CHUNK):
+            yield block
+            if block.stop:
+                return
+        batch = []
+    yield from pool.imap(_work_on_block, batch, chunksize=POOL_CHUNK)
+
+
+def _work_on_block(inflated: Inflated) -> Block:
+    """Split and extract one block (in a worker process)."""
+    entries, stop = _split(inflated.data, verbose=inflated.first)
+    return Block(inflated.end, entries, _extract(entries), stop)
+
+
+def _inflate_blocks(dictionary_path: Path, start: int) -> Iterator[Inflated]:
+    """Yield each zlib block in a file from `start` on, decompressed.
+
+    The file is mmapped, and candidates are only tried where there's a valid
+    zlib header, instead of trying to decompress at every byte.
+    """
+    with (
+        dictionary_path.open("rb") as fobj,
+        mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ) as content,
+    ):
+        view = memoryview(content)
+        try:
+            pos = start
+            first = True
+            while (pos := content.find(bytes([ZLIB_CMF]), pos)) != -1:
+                if pos + 1 < len(view) and (view[pos] << 8 | view[pos + 1]) % 31 == 0:
+                    if (inflated := _inflate(view, pos)) is not None:
+                        pos, data = inflated
+                        yield Inflated(pos, data, first)
+                        first = False
+                        continue
+                pos += 1  # Not a zlib block after all
+        finally:
+            view.release()
+
+
+def _inflate(view: memoryview, pos: int) -> tuple[int, bytes] | None:
+    """Decompress the zlib block at `pos` (if any); return its end and data."""
+    dec = zlib.decompressobj()
+    end = pos
+    parts = []
+    try:
+        while not dec.eof and end < len(view):
+            chunk = view[end:end + READ_CHUNK]
+            end += len(chunk)
+            parts.append(dec.decompress(chunk))
+            chunk.release()
+    except zlib.error:
+        return None
+    if not dec.eof:
+        return None
+    return end - len(dec.unused_data), b"".join(parts)
+
+
+def _split(input_bytes: bytes, *, verbose: bool) -> tuple[list[Entry], bool]:
     """Split `input_bytes` into a list of tuples (name, definition)."""
     printv = print if verbose else lambda *_, **__: ...
 
-    # The first four bytes are always not UTF-8 (not sure why?)
-    input_bytes = input_bytes[4:]
-
     printv("Splitting...")
     printv(f'{"index": <10}', f'{"bytes": <30}', f'{"as chars"}', "-" * 50, sep="\n")
 
     entries = []
-    total_offset = 0
     stop_further_parsing = False
 
-    while True:
-        # Find the next newline, which delimits the current entry.
-        try:
-            next_offset = input_bytes.index(b"\n")
-        except ValueError:  # No more new-lines -> no more entries!
-            break
-
-        entry_text = input_bytes[:next_offset].decode("utf-8")
+    # The first four bytes are always not UTF-8 (not sure why?)
+    offset = 4
+    # Find the next newline, which delimits the current entry.
+    while (next_offset := input_bytes.find(b"\n", offset)) != -1:
+        entry_text = input_bytes[offset:next_offset].decode("utf-8")
 
         # The final part of the dictionary contains some meta info, which we skip.
-        if "fbm_AdvisoryBoard" in entry_text[:1000]:
-            print("fbm_AdvisoryBoard detected, stopping...")
+        if STOP_MARK in entry_text[:1000]:
+            print(f"{STOP_MARK} detected, stopping...")
             stop_further_parsing = True
             break
 
@@ -164,15 +316,14 @@ def _split(input_bytes: bytes, *, verbose: bool) -> tuple[list[tuple[str, str]],
         entries.append((name, entry_text))
 
         printv(
-            f"{next_offset + total_offset: 10d}",
+            f"{next_offset: 10d}",
             f"{input_bytes[next_offset + 1:next_offset + 5]!s:<30}",
-            xml_entry.get(key),
+            name,
         )
 
         # There is always 4 bytes of chibberish between entries. Skip them
         # and the new lines (for a total of 5 bytes).
-        input_bytes = input_bytes[next_offset + 5:]
-        total_offset += next_offset
+        offset = next_offset + 5
     return entries, stop_further_parsing
 
 
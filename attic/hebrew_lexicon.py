@@ -0,0 +1,186 @@
+"""HebrewLexicon: Memory-mapped table of (pointed) Hebrew words."""
+import bisect
+import mmap
+import re
+import struct
+import typing as t
+from array import array
+
+if t.TYPE_CHECKING:
+    from collections.abc import Iterable
+    from collections.abc import Iterator
+    from pathlib import Path
+
+__all__ = [
+    "PREFIXES",
+    "HebrewLexicon",
+]
+
+PREFIXES = ("הַ", "וּ", "וְ", "שֶׁ")
+_NIQQ = "\u05B0-\u05BC\u05C1\u05C2"
+NIQQ_RE = re.compile(f"[{_NIQQ}]")
+
+
+class _StringTable:
+    """Sorted (or not) strings in a buffer: count, offsets, UTF-8 blob."""
+
+    def __init__(self, buf: memoryview, offset: int) -> None:
+        (self.count,) = struct.unpack_from("=I", buf, offset)
+        offsets_end = offset + 4 + 4 * (self.count + 1)
+        self.offsets = buf[offset + 4:offsets_end].cast("I")
+        self.blob = buf[offsets_end:]
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, idx: int) -> bytes:
+        return bytes(self.blob[self.offsets[idx]:self.offsets[idx + 1]])
+
+    def release(self) -> None:
+        """Let go of the underlying buffer."""
+        self.offsets.release()
+        self.blob.release()
+
+    @classmethod
+    def pack(cls, strings: Iterable[str]) -> bytes:
+        """Serialize strings, padded to 4 bytes."""
+        blob = bytearray()
+        offsets = array("I", [0])
+        for string in strings:
+            blob += string.encode("utf-8")
+            offsets.append(len(blob))
+        blob += bytes(-len(blob) % 4)
+        return struct.pack("=I", len(offsets) - 1) + offsets.tobytes() + blob
+
+
+class HebrewLexicon:
+    """Memory-mapped table of (pointed) Hebrew words.
+
+    Nothing is loaded when opening; lookups are binary searches in the
+    mapped file.  Layout: a header with section offsets, then the words
+    (sorted), the dictionary key of each word, the unpointed form of each
+    word (sorted) and, per unpointed form, the index of its word.
+    """
+
+    MAGIC = b"EVHLEX01"
+    _HEADER = struct.Struct("=8s4Q")
+
+    path: Path
+    words: _StringTable
+    keys: _StringTable
+    bares: _StringTable
+    bare_to_word: memoryview
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        with path.open("rb") as fobj:
+            self._mmap = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mmap)
+        (magic, *offsets) = self._HEADER.unpack_from(self._buf)
+        if magic != self.MAGIC:
+            raise ValueError(f"{path} is not a lexicon file")
+        (words_at, keys_at, bares_at, b2w_at) = offsets
+        self.words = _StringTable(self._buf, words_at)
+        self.keys = _StringTable(self._buf, keys_at)
+        self.bares = _StringTable(self._buf, bares_at)
+        self.bare_to_word = self._buf[b2w_at:b2w_at + 4 * len(self.bares)].cast("I")
+
+    def __enter__(self) -> t.Self:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Unmap the file."""
+        self.words.release()
+        self.keys.release()
+        self.bares.release()
+        self.bare_to_word.release()
+        self._buf.release()
+        self._mmap.close()
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __contains__(self, word: object) -> bool:
+        return isinstance(word, str) and self._index(word) is not None
+
+    def _index(self, word: str) -> int | None:
+        """Find the index of an exact word."""
+        needle = word.encode("utf-8")
+        idx = bisect.bisect_left(self.words, needle)
+        if idx < len(self.words) and self.words[idx] == needle:
+            return idx
+        return None
+
+    def key(self, word: str) -> str | None:
+        """Return the dictionary entry in which `word` was found."""
+        if (idx := self._index(word)) is None:
+            return None
+        return self.keys[idx].decode("utf-8")
+
+    @classmethod
+    def stems(cls, word: str, prefixes: Iterable[str] = PREFIXES) -> Iterator[str]:
+        """Yield `word`, and what's left of it without any prefix it has."""
+        yield word
+        for prefix in prefixes:
+            if word.startswith(prefix) and len(word) > len(prefix):
+                yield word[len(prefix):]
+
+    def known(self, word: str, prefixes: Iterable[str] = PREFIXES) -> bool:
+        """Check whether a word is in the lexicon, maybe after a prefix."""
+        return any(stem in self for stem in self.stems(word, prefixes))
+
+    @classmethod
+    def unpoint(cls, word: str) -> str:
+        """Remove niqqud."""
+        return NIQQ_RE.sub("", word)
+
+    def variants(self, word: str) -> list[str]:
+        """Return all words which are `word` when ignoring niqqud."""
+        needle = self.unpoint(word).encode("utf-8")
+        idx = bisect.bisect_left(self.bares, needle)
+        variants = []
+        while idx < len(self.bares) and self.bares[idx] == needle:
+            variants.append(self.words[self.bare_to_word[idx]].decode("utf-8"))
+            idx += 1
+        return variants
+
+    @classmethod
+    def build(cls, path: Path, word_to_key: dict[str, str]) -> None:
+        """Write a lexicon file."""
+        words = sorted(word_to_key)
+        bare_to_word = sorted(
+            range(len(words)),
+            key=lambda idx: (cls.unpoint(words[idx]), idx),
+        )
+        sections = [
+            _StringTable.pack(words),
+            _StringTable.pack(word_to_key[word] for word in words),
+            _StringTable.pack(cls.unpoint(words[idx]) for idx in bare_to_word),
+            array("I", bare_to_word).tobytes(),
+        ]
+        offsets = []
+        offset = cls._HEADER.size
+        for section in sections:
+            offsets.append(offset)
+            offset += len(section)
+        with path.open("wb") as fobj:
+            fobj.write(cls._HEADER.pack(cls.MAGIC, *offsets))
+            for section in sections:
+                fobj.write(section)
+
+    @classmethod
+    def from_words_file(cls, words_path: Path, path: Path | None = None) -> t.Self:
+        """Open the lexicon for a `word<TAB>key` file, (re)building as needed."""
+        if path is None:
+            path = words_path.with_suffix(".lexicon")
+        if not path.is_file() or path.stat().st_mtime < words_path.stat().st_mtime:
+            print(f"Indexing {words_path} as {path}...")
+            with words_path.open(encoding="utf-8") as fobj:
+                word_to_key = dict(
+                    line.rstrip("\n").split("\t", 1) for line in fobj if "\t" in line
+                )
+            cls.build(path, word_to_key)
+        return cls(path)
@@ -1,19 +1,38 @@
 #!/usr/bin/env python3
 """Search and download from libgen."""
 import argparse
+import contextlib
+import fcntl
+import itertools
+import json
 import logging
 import random
 import re
+import sqlite3
 import subprocess
+import sys
+import threading
+import time
 import tomllib
 import typing as t
 import urllib.parse as urlparse
+from collections.abc import Iterable
+from collections.abc import Iterator
 from collections.abc import Sequence
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from concurrent.futures import wait
+from dataclasses import asdict
 from dataclasses import dataclass
+from dataclasses import replace
 from pathlib import Path
 
 import bs4  # type: ignore[import-untyped]
+import bs4.builder  # type: ignore[import-untyped]
 import requests  # type: ignore[import-untyped]
+import requests.adapters  # type: ignore[import-untyped]
 import requests.exceptions  # type: ignore[import-untyped]
 import rich.logging  # type: ignore[import-untyped]
 import rich.progress  # type: ignore[import-untyped]
@@ -76,11 +95,382 @@ class Hit:  # pylint: disable=too-many-instance-attributes
             lines.append("* Will resume partial download")
         return "\n".join(lines)
 
+    def to_json(self) -> str:
+        """Serialize, for the download queue."""
+        return json.dumps(asdict(self), default=str)
+
+    @classmethod
+    def from_json(cls, text: str) -> t.Self:
+        """Deserialize what `to_json()` made."""
+        hit = cls(**json.loads(text))
+        hit.path = Path(hit.path)
+        hit.work_path = Path(hit.work_path)
+        return hit
+
 
 class WrongReplyError(RuntimeError):
     """Raised when the HTML we get isn't what we expected."""
 
 
+@dataclass
+class QueueItem:
+    """A queued download."""
+
+    rowid: int
+    hit: Hit
+    attempts: int
+
+
+class DownloadQueue:
+    """Downloads waiting for `lgdl --worker`, and how mirrors did (SQLite).
+
+    Items go queued -> active -> done; a failed download goes back to
+    queued with a `next_try` `RETRY_DELAY` later (doubling each time),
+    or to failed after `MAX_ATTEMPTS`. Mirrors are keyed by host name,
+    with counts of downloads that worked and didn't, and throughput.
+    """
+
+    PATH = Path.home() / ".lgdl" / "queue.sqlite"
+    MAX_ATTEMPTS = 8
+    RETRY_DELAY = 60.0  # Seconds
+    MAX_RETRY_DELAY = 6 * 3600.0
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS queue (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            hit TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_try REAL NOT NULL DEFAULT 0,
+            added REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS mirrors (
+            netloc TEXT PRIMARY KEY,
+            successes INTEGER NOT NULL DEFAULT 0,
+            failures INTEGER NOT NULL DEFAULT 0,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            seconds REAL NOT NULL DEFAULT 0
+        );
+    """
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")  # Readers don't wait for writers
+        self.db.executescript(self.SCHEMA)
+
+    def close(self) -> None:
+        """Close the database."""
+        self.db.close()
+
+    @contextlib.contextmanager
+    def worker_lock(self) -> Iterator[bool]:
+        """Be the worker, if no other process is; yield whether we are."""
+        with self.path.with_suffix(".lock").open("w") as fobj:
+            try:
+                fcntl.flock(fobj, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+            else:
+                yield True
+
+    def has_worker(self) -> bool:
+        """Whether some process is working the queue."""
+        with self.worker_lock() as locked:
+            return not locked
+
+    def add(self, hit: Hit, *, again: bool = False) -> bool:
+        """Queue `hit`; False if it's being downloaded, or done (unless `again`).
+
+        Paths are made absolute, as the worker may run elsewhere.
+        """
+        hit = replace(hit, path=hit.path.resolve(), work_path=hit.work_path.resolve())
+        with self.lock, self.db:
+            cursor = self.db.execute(
+                """
+                INSERT INTO queue (path, hit, added) VALUES (?, ?, ?)
+                ON CONFLICT (path) DO UPDATE
+                SET hit = excluded.hit, state = 'queued', attempts = 0, next_try = 0
+                WHERE state != 'active' AND (state != 'done' OR ?)
+                """,
+                (str(hit.path), hit.to_json(), time.time(), again),
+            )
+        return cursor.rowcount > 0
+
+    def requeue_active(self) -> None:
+        """Put back what a dead worker was downloading."""
+        with self.lock, self.db:
+            self.db.execute("UPDATE queue SET state = 'queued' WHERE state = 'active'")
+
+    def claim(self, count: int) -> list[QueueItem]:
+        """Mark up to `count` items that are due as active, and return them."""
+        if count <= 0:
+            return []
+        with self.lock, self.db:
+            rows = self.db.execute(
+                """
+                SELECT id, hit, attempts FROM queue
+                WHERE state = 'queued' AND next_try <= ?
+                ORDER BY next_try, id LIMIT ?
+                """,
+                (time.time(), count),
+            ).fetchall()
+            self.db.executemany(
+                "UPDATE queue SET state = 'active' WHERE id = ?",
+                [(rowid,) for rowid, _, _ in rows],
+            )
+        return [
+            QueueItem(rowid, Hit.from_json(hit), attempts)
+            for rowid, hit, attempts in rows
+        ]
+
+    def finish(self, item: QueueItem, *, done: bool) -> float | None:
+        """Note how `item` went; return the delay till the retry, if any."""
+        attempts = item.attempts + 1
+        delay = None
+        if done:
+            state = "done"
+        elif attempts >= self.MAX_ATTEMPTS:
+            state = "failed"
+        else:
+            state = "queued"
+            delay = min(self.RETRY_DELAY * 2 ** (attempts - 1), self.MAX_RETRY_DELAY)
+        with self.lock, self.db:
+            self.db.execute(
+                "UPDATE queue SET state = ?, attempts = ?, next_try = ? WHERE id = ?",
+                (state, attempts, time.time() + (delay or 0), item.rowid),
+            )
+        return delay
+
+    def next_try(self) -> float | None:
+        """When the next queued item is due, if there is one."""
+        with self.lock:
+            (next_try,) = self.db.execute(
+                "SELECT min(next_try) FROM queue WHERE state = 'queued'",
+            ).fetchone()
+        return next_try
+
+    def items(self) -> list[tuple[str, int, float, Hit]]:
+        """(state, attempts, next_try, hit) of everything, oldest first."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT state, attempts, next_try, hit FROM queue ORDER BY id",
+            ).fetchall()
+        return [
+            (state, attempts, next_try, Hit.from_json(hit))
+            for state, attempts, next_try, hit in rows
+        ]
+
+    def record(
+        self,
+        mirror: str,
+        *,
+        ok: bool,
+        nbytes: int = 0,
+        seconds: float = 0.0,
+    ) -> None:
+        """Note how a download from `mirror` went."""
+        with self.lock, self.db:
+            self.db.execute(
+                """
+                INSERT INTO mirrors (netloc, successes, failures, bytes, seconds)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (netloc) DO UPDATE SET
+                    successes = successes + excluded.successes,
+                    failures = failures + excluded.failures,
+                    bytes = bytes + excluded.bytes,
+                    seconds = seconds + excluded.seconds
+                """,
+                (urlparse.urlsplit(mirror).netloc, ok, not ok, nbytes, seconds),
+            )
+
+    def mirror_stats(self) -> list[tuple[str, int, int, float]]:
+        """(netloc, successes, failures, bytes/s) of all mirrors, best first."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT netloc, successes, failures, bytes, seconds FROM mirrors",
+            ).fetchall()
+        stats = [
+            (netloc, successes, failures, nbytes / seconds if seconds else 0.0)
+            for netloc, successes, failures, nbytes, seconds in rows
+        ]
+        return sorted(stats, key=lambda stat: self.score(*stat[1:]), reverse=True)
+
+    @staticmethod
+    def score(successes: int, failures: int, speed: float) -> float:
+        """Return expected throughput: speed times (smoothed) odds of success."""
+        return speed * (successes + 1) / (successes + failures + 2)
+
+    def health(self, mirrors: Iterable[str]) -> dict[str, float]:
+        """`score()` of those of `mirrors` that ever worked."""
+        stats = {
+            netloc: self.score(successes, failures, speed)
+            for netloc, successes, failures, speed in self.mirror_stats()
+            if successes
+        }
+        return {
+            mirror: stats[netloc]
+            for mirror in mirrors
+            if (netloc := urlparse.urlsplit(mirror).netloc) in stats
+        }
+
+
+class HitCache:
+    """Every hit ever seen, and which hits each query got (SQLite).
+
+    Query results are good for `max_age` seconds. All hits also go into
+    a full-text index (FTS5, where SQLite has it) for offline searches.
+    Hits are keyed like `LibgenDownload.merge_hits()` does, so a hit
+    seen again (with new mirrors, say) replaces the old one.
+    """
+
+    PATH = Path.home() / ".lgdl" / "hits.sqlite"
+    SEARCH_LIMIT = 200
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS queries (
+            host TEXT NOT NULL,
+            query TEXT NOT NULL,
+            fields TEXT NOT NULL,
+            topics TEXT NOT NULL,
+            contents TEXT NOT NULL,
+            fetched REAL NOT NULL,
+            keys TEXT NOT NULL,
+            PRIMARY KEY (host, query, fields, topics, contents)
+        );
+        CREATE TABLE IF NOT EXISTS hits (
+            key TEXT PRIMARY KEY,
+            hit TEXT NOT NULL,
+            seen REAL NOT NULL
+        );
+    """
+    FTS_SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS hits_fts USING fts5(
+            key UNINDEXED, title, authors, publisher, year, language,
+            tokenize = 'unicode61 remove_diacritics 2'
+        );
+    """
+
+    def __init__(self, path: Path, log: logging.Logger | None = None) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.log = log or logging.getLogger()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript(self.SCHEMA)
+        try:
+            self.db.executescript(self.FTS_SCHEMA)
+        except sqlite3.OperationalError as exc:
+            self.log.debug("No full-text index: %s", exc)
+            self.fts = False
+        else:
+            self.fts = True
+
+    def close(self) -> None:
+        """Close the database."""
+        self.db.close()
+
+    @staticmethod
+    def hit_key(hit: Hit) -> str:
+        """LibGen ID, or name if none."""
+        return str(hit.lgid) if hit.lgid is not None else f"name:{hit.name}"
+
+    def get(
+        self,
+        host: str,
+        key: tuple[str, str, str, str],
+        max_age: float,
+    ) -> list[Hit] | None:
+        """Hits of a query no older than `max_age` seconds; None if none."""
+        with self.lock:
+            row = self.db.execute(
+                """
+                SELECT keys FROM queries
+                WHERE host = ? AND query = ? AND fields = ? AND topics = ?
+                AND contents = ? AND fetched >= ?
+                """,
+                (host, *key, time.time() - max_age),
+            ).fetchone()
+            if row is None:
+                return None
+            hits = dict(
+                self.db.execute(
+                    """
+                    SELECT key, hit FROM hits
+                    WHERE key IN (SELECT value FROM json_each(?))
+                    """,
+                    row,
+                ).fetchall(),
+            )
+        keys = json.loads(row[0])
+        if not hits:  # Cached before we knew better than to cache no hits
+            return None
+        return [Hit.from_json(hits[key]) for key in keys if key in hits]
+
+    def put(self, host: str, key: tuple[str, str, str, str], hits: list[Hit]) -> None:
+        """Remember the hits of a query, and index them."""
+        now = time.time()
+        keys = [self.hit_key(hit) for hit in hits]
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO hits (key, hit, seen) VALUES (?, ?, ?)",
+                [
+                    (hit_key, hit.to_json(), now)
+                    for hit_key, hit in zip(keys, hits, strict=True)
+                ],
+            )
+            if self.fts:
+                self.db.executemany(
+                    "DELETE FROM hits_fts WHERE key = ?",
+                    [(hit_key,) for hit_key in keys],
+                )
+                self.db.executemany(
+                    """
+                    INSERT INTO hits_fts
+                    (key, title, authors, publisher, year, language)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    [
+                        (
+                            hit_key,
+                            hit.title,
+                            hit.authors,
+                            hit.publisher,
+                            hit.year,
+                            hit.language,
+                        )
+                        for hit_key, hit in zip(keys, hits, strict=True)
+                    ],
+                )
+            self.db.execute(
+                """
+                INSERT OR REPLACE INTO queries
+                (host, query, fields, topics, contents, fetched, keys)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                """,
+                (host, *key, now, json.dumps(keys)),
+            )
+
+    def search(self, query: str) -> list[Hit]:
+        """Hits matching all words of `query` (as prefixes), best first."""
+        if not self.fts:
+            self.log.info("SQLite lacks FTS5, so there's no offline search")
+            return []
+        match = " ".join(f'"{word}"*' for word in query.replace('"', '""').split())
+        if not match:
+            return []
+        with self.lock:
+            rows = self.db.execute(
+                """
+                SELECT hits.hit FROM hits_fts JOIN hits USING (key)
+                WHERE hits_fts MATCH ? ORDER BY hits_fts.rank LIMIT ?
+                """,
+                (match, self.SEARCH_LIMIT),
+            ).fetchall()
+        return [Hit.from_json(hit) for (hit,) in rows]
+
+
 class LibgenDownload:
     """Simple Library Genesis search + download."""
 
@@ -92,7 +482,7 @@ class LibgenDownload:
         parser.add_argument(
             "query",
             metavar="QUERY",
-            nargs="+",
+            nargs="*",
             help="what to search for",
         )
         parser.add_argument(
@@ -163,11 +553,60 @@ class LibgenDownload:
                 "*m*agazines, *s*tandards)"
             ),
         )
+        parser.add_argument(
+            "-s",
+            "--segments",
+            type=int,
+            help="download each file in up to this many concurrent parts",
+        )
+        parser.add_argument(
+            "-l",
+            "--local",
+            action="store_true",
+            help="search every hit seen before, offline, instead of LibGen",
+        )
+        parser.add_argument(
+            "-a",
+            "--max-age",
+            type=float,
+            help="reuse results of the same query up to this many hours old",
+        )
+        parser.add_argument(
+            "-q",
+            "--queue",
+            action="store_true",
+            help="queue chosen files for a background worker, don't wait",
+        )
+        parser.add_argument(
+            "-w",
+            "--worker",
+            action="store_true",
+            help="download everything queued, then exit",
+        )
+        parser.add_argument(
+            "-S",
+            "--status",
+            action="store_true",
+            help="show the download queue and mirror stats",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            help="how many queued files the worker downloads at once",
+        )
+        parser.add_argument(
+            "-r",
+            "--rate",
+            type=byte_size,
+            help="limit download bandwidth, in bytes per second (e.g. 500K, 2M)",
+        )
         parser.add_argument(
             "-H",
             "--host",
-            type=str,
-            help="LibGen search host",
+            dest="hosts",
+            action="append",
+            help="LibGen search host (repeat to search several at once)",
         )
 
         defaults = {
@@ -176,7 +615,10 @@ class LibgenDownload:
             "fields": "tai",
             "topics": "fl",
             "contents": "f",
-            "host": "libgen.gs",
+            "segments": 4,
+            "jobs": 2,
+            "max_age": 24,
+            "hosts": ["libgen.gs"],
         }
         for folder in [Path.home(), Path.cwd()]:
             path = folder / ".lgdlrc"
@@ -187,16 +629,32 @@ class LibgenDownload:
                 continue
             except tomllib.TOMLDecodeError:
                 self.log.exception(path)
+        if "host" in defaults:  # Before there were `hosts`
+            defaults["hosts"] = [defaults.pop("host")]
+        # `append` would add to the default list, rather than replace it
+        default_hosts = defaults.pop("hosts")
         parser.set_defaults(**defaults)
 
         self.args = parser.parse_args()
+        if not (self.args.query or self.args.worker or self.args.status):
+            parser.error("the following arguments are required: QUERY")
+        self.args.hosts = self.args.hosts or default_hosts
         self.query = " ".join(self.args.query)
 
     BAD_CHARS_RE = re.compile(r"[#%&{}<>*?!:@/\\|]")
+    # lxml, if installed, and only what `get_raw_hits()` looks at (the results
+    # table and the "Files 0" link) are faster; see bench_lgdl_parse.py
+    PARSER = "lxml" if bs4.builder.builder_registry.lookup("lxml") else "html.parser"
+    QUERY_ONLY = bs4.SoupStrainer(["table", "a"])
+    MIRROR_TIMEOUT = (5, 15)  # Connect, read (seconds); slow mirrors lose anyway
+    PREFER_WAIT = 2.0  # Head start (seconds) for the mirror that did best before
+    WORKER_POLL = 30.0  # Seconds between looks at the queue, when waiting
     args: argparse.Namespace
     ext_col: str
     log: logging.Logger
     http: "Http"
+    queue: DownloadQueue
+    hit_cache: HitCache
     query: str
     progress: rich.progress.Progress
 
@@ -205,7 +663,28 @@ class LibgenDownload:
         self.parse_args()
         self.configure_logging()
 
-        self.http = Http(self.args.user_agent, log=self.log)
+        self.http = Http(
+            self.args.user_agent,
+            log=self.log,
+            segments=self.args.segments,
+            rate=self.args.rate,
+        )
+        self.queue = DownloadQueue(DownloadQueue.PATH)
+        self.hit_cache = HitCache(HitCache.PATH, log=self.log)
+        with (
+            contextlib.closing(self.http),
+            contextlib.closing(self.queue),
+            contextlib.closing(self.hit_cache),
+        ):
+            if self.args.status:
+                self.show_status()
+            elif self.args.worker:
+                self.run_worker()
+            else:
+                self.run_interactive()
+
+    def run_interactive(self) -> None:
+        """Query, choose, download (or queue)."""
         hits = self.run_query()
         if not hits:
             self.log.info("No hits; better luck next time!")
@@ -220,10 +699,125 @@ class LibgenDownload:
             return
 
         self.args.output.mkdir(parents=True, exist_ok=True)
+        if self.args.queue:
+            for nhit in choices:
+                self.enqueue(hits[nhit])
+            self.start_worker()
+            return
         with DownloadProgress() as self.progress:
             for nhit in choices:
                 self.download(hits[nhit])
 
+    def enqueue(self, hit: Hit) -> None:
+        """Queue one file for the worker."""
+        if self.args.overwrite:
+            hit.work_path.unlink(missing_ok=True)
+            Http.segments_path(hit.work_path).unlink(missing_ok=True)
+        if self.queue.add(hit, again=self.args.overwrite):
+            self.log.info("Queued %s (%s)", hit.name, hit.size_desc)
+        else:
+            self.log.info("Already downloading, or downloaded: %s", hit.name)
+
+    def start_worker(self) -> None:
+        """Start a worker in the background, unless one is running."""
+        if self.queue.has_worker():
+            self.log.info("The running worker will get to it")
+            return
+        args = [sys.executable, str(Path(__file__).resolve()), "--worker"]
+        args += ["--jobs", str(self.args.jobs), "--segments", str(self.args.segments)]
+        if self.args.rate:
+            args += ["--rate", str(self.args.rate)]
+        if self.args.user_agent:
+            args += ["--user-agent", self.args.user_agent]
+        log_path = DownloadQueue.PATH.with_name("worker.log")
+        with log_path.open("a", encoding="utf-8") as log_file:
+            subprocess.Popen(  # pylint: disable=consider-using-with
+                args,
+                stdin=subprocess.DEVNULL,
+                stdout=log_file,
+                stderr=subprocess.STDOUT,
+                start_new_session=True,
+            )
+        self.log.info("Started a worker; see %s, or lgdl --status", log_path)
+
+    def run_worker(self) -> None:
+        """Download what's queued, `--jobs` at a time, until nothing is left."""
+        while True:
+            with self.queue.worker_lock() as locked:
+                if not locked:
+                    self.log.info("Another worker is running")
+                    return
+                self.work_queue()
+            # Whatever was queued after our last look, but before we let go
+            # of the lock, is ours: `start_worker()` saw that we were running
+            if self.queue.next_try() is None:
+                break
+        self.log.info("Queue is empty")
+
+    def work_queue(self) -> None:
+        """Download until the queue is empty; the worker lock must be held."""
+        self.queue.requeue_active()  # A previous worker died
+        jobs = max(self.args.jobs, 1)
+        running: set[Future] = set()
+        with (
+            DownloadProgress() as self.progress,
+            ThreadPoolExecutor(max_workers=jobs) as pool,
+        ):
+            while True:
+                for item in self.queue.claim(jobs - len(running)):
+                    running.add(pool.submit(self.work, item))
+                if running:
+                    _, running = wait(
+                        running,
+                        timeout=self.WORKER_POLL,
+                        return_when=FIRST_COMPLETED,
+                    )
+                    continue
+                next_try = self.queue.next_try()
+                if next_try is None:
+                    break
+                time.sleep(min(max(next_try - time.time(), 0), self.WORKER_POLL))
+
+    def work(self, item: QueueItem) -> None:
+        """Download one queued file, and note how it went."""
+        try:
+            done = self.download(item.hit)
+        except Exception:  # pylint: disable=broad-exception-caught
+            self.log.exception(item.hit.name)
+            done = False
+        retry = self.queue.finish(item, done=done)
+        if retry is not None:
+            self.log.info(
+                "%s: attempt %d failed, retrying in %.0f min",
+                item.hit.name,
+                item.attempts + 1,
+                retry / 60,
+            )
+
+    def show_status(self) -> None:
+        """Print the queue and mirror stats."""
+        now = time.time()
+        for state, attempts, next_try, hit in self.queue.items():
+            when = ""
+            if state == "queued" and next_try > now:
+                when = f", next try in {int(next_try - now) // 60}m"
+            self.log.info(
+                "%-6s %s (%s; %d attempt(s)%s)",
+                state,
+                hit.name,
+                hit.size_desc,
+                attempts,
+                when,
+            )
+        for netloc, successes, failures, speed in self.queue.mirror_stats():
+            self.log.info(
+                "%s: %d ok, %d failed, %s/s",
+                netloc,
+                successes,
+                failures,
+                Http.kbmbgb(speed),
+            )
+
     def configure_logging(self) -> None:
         """Set logging format and level."""
         level = logging.DEBUG if self.args.debug else logging.INFO
@@ -236,9 +830,13 @@ class LibgenDownload:
         self.log = logging.getLogger("lgdl")
 
     def run_query(self) -> list[Hit]:
-        """Search LibGen and grok the result."""
-        html = self.get_query_reply()
-        hits = self.get_raw_hits(html)
+        """Search LibGen (or the hit cache) and grok the result."""
+        if self.args.local:
+            hits = [self.localize(hit) for hit in self.hit_cache.search(self.query)]
+        else:
+            hits = self.merge_hits(
+                hit for _, host_hits in self.get_host_hits() for hit in host_hits
+            )
 
         # Only files we CAN download
         hits = list(filter(lambda hit: hit.mirrors, hits))
@@ -249,11 +847,72 @@ class LibgenDownload:
 
         return hits
 
-    def get_query_reply(self) -> str:
+    def get_host_hits(self) -> Iterator[tuple[str, list[Hit]]]:
+        """Yield (host, hits) for all hosts: cached if fresh, else queried."""
+        key = self.cache_key()
+        hosts = []
+        for host in self.args.hosts:
+            cached = None
+            if not self.args.reload and self.args.max_age > 0:
+                cached = self.hit_cache.get(host, key, self.args.max_age * 3600)
+            if cached is None:
+                hosts.append(host)
+            else:
+                self.log.debug("%s: %d cached hit(s)", host, len(cached))
+                yield host, [self.localize(hit) for hit in cached]
+
+        for host, html in self.get_query_replies(hosts):
+            hits = self.get_raw_hits(html, host)
+            # No hits may just as well be a captcha, or an error page
+            if hits and not self.args.reload:
+                self.hit_cache.put(host, key, hits)
+            yield host, hits
+
+    def cache_key(self) -> tuple[str, str, str, str]:
+        """Return what, besides the host, the results of a query depend on."""
+        query = " ".join(self.query.casefold().split())
+        return query, self.args.fields, self.args.topics, self.args.contents
+
+    def localize(self, hit: Hit) -> Hit:
+        """Adapt a hit from the cache to this run's output folder and files."""
+        hit.path = self.args.output / hit.path.name
+        hit.work_path = self.args.output / hit.work_path.name
+        hit.resume = not self.args.overwrite and hit.work_path.is_file()
+        random.shuffle(hit.mirrors)
+        return hit
+
+    def get_query_replies(self, hosts: list[str]) -> Iterator[tuple[str, str]]:
+        """Query `hosts` at once; yield (host, HTML) as replies come."""
+        if not hosts:
+            return
+        with ThreadPoolExecutor(max_workers=len(hosts)) as pool:
+            futures = {pool.submit(self.get_query_reply, host): host for host in hosts}
+            for future in as_completed(futures):
+                host = futures[future]
+                try:
+                    yield host, future.result()
+                except (requests.exceptions.RequestException, OSError) as exc:
+                    self.log.info("%s: %s", host, exc)
+
+    @staticmethod
+    def merge_hits(hits: Iterable[Hit]) -> list[Hit]:
+        """Dedupe hits from several hosts by LibGen ID, pooling their mirrors."""
+        merged: dict[int | str, Hit] = {}
+        for hit in hits:
+            key = hit.lgid if hit.lgid is not None else hit.name
+            if (seen := merged.get(key)) is None:
+                merged[key] = hit
+            else:
+                seen.mirrors.extend(
+                    url for url in hit.mirrors if url not in seen.mirrors
+                )
+        return list(merged.values())
+
+    def get_query_reply(self, host: str) -> str:
         """Run the LibGen query and return the raw HTML."""
         if self.args.reload:
             # Don't really search (useful for debugging)
-            with self.open_dump("query", "html", "r") as fobj:
+            with self.open_dump(f"query-{host}", "html", "r") as fobj:
                 return fobj.read()
 
         params = [
@@ -272,7 +931,7 @@ class LibgenDownload:
             ("objects[]", content)
             for content in self.args.contents
         ]
-        url = f"https://{self.args.host}/index.php?" + "&".join(
+        url = f"https://{host}/index.php?" + "&".join(
             f"{urlparse.quote(name)}={urlparse.quote(value)}"
             for name, value in params
         )
@@ -280,9 +939,9 @@ class LibgenDownload:
         response = self.http.get(url)
         return response.text
 
-    def get_raw_hits(self, html: str) -> list[Hit]:
+    def get_raw_hits(self, html: str, host: str) -> list[Hit]:
         """Parse query results and return all items, even unwanted ones."""
-        soup = self.parse_html(html, "query")
+        soup = self.parse_html(html, f"query-{host}", parse_only=self.QUERY_ONLY)
 
         # Special case: zero hits found
         for atag in soup.find_all("a", class_="nav-link"):
@@ -293,12 +952,12 @@ class LibgenDownload:
         # In v1, the table has an ID, so that's easy
         table = soup.find("table", id="tablelibgen")
         if isinstance(table, bs4.Tag):
-            return self.get_raw_hits_v1(table)
+            return self.get_raw_hits_v1(table, host)
 
         # In v2, the table is harder to find an parse
         for table in soup.find_all("table", attrs={"class": "c"}):
             if isinstance(table, bs4.Tag):
-                return self.get_raw_hits_v2(table)
+                return self.get_raw_hits_v2(table, host)
 
         self.log.error("Cannot find table in HTML")
         return []
@@ -306,6 +965,7 @@ class LibgenDownload:
     def get_raw_hits_v1(
         self,
         table: bs4.Tag,
+        host: str,
     ) -> list[Hit]:
         """Convert v1 (libgen.gs) table to hits."""
         try:
@@ -317,8 +977,8 @@ class LibgenDownload:
             self.check_columns(columns)
 
             return [
-                self.parse_row(row, columns)
-                for row in self.find_tag(table, "tbody").find_all("tr")
+                self.parse_row(row, columns, host)
+                for row in self.find_tag(table, "tbody").find_all("tr", recursive=False)
             ]
         except WrongReplyError as wre:
             self.log.debug("Unexpected HTML returned from query: %s", wre)
@@ -327,6 +987,7 @@ class LibgenDownload:
     def get_raw_hits_v2(
         self,
         table: bs4.Tag,
+        host: str,
     ) -> list[Hit]:
         """Convert v2 (libgen.is) table to hits."""
         try:
@@ -343,7 +1004,7 @@ class LibgenDownload:
                     self.ext_col = "Extension"
                     self.check_columns(columns)
                 else:
-                    hits.append(self.parse_row(row, columns))
+                    hits.append(self.parse_row(row, columns, host))
         except WrongReplyError as wre:
             self.log.debug("Unexpected HTML returned from query: %s", wre)
             return []
@@ -378,18 +1039,19 @@ class LibgenDownload:
             return []
         return choices
 
-    def download(self, hit: Hit):
-        """Download one file, trying all mirrors."""
+    def download(self, hit: Hit) -> bool:
+        """Download one file, trying all mirrors; return whether we got it."""
         self.log.info("%s (%s)", hit.name, hit.size_desc)
         self.log.debug("%s (%d mirror(s))", hit.work_path, len(hit.mirrors))
 
-        for mirror in hit.mirrors:
-            if self.download_mirror(hit, mirror):
-                hit.work_path.rename(hit.path)
-                if self.args.view:
-                    self.log.debug("Trying to open %s", hit.path)
-                    subprocess.run(["open", str(hit.path)], check=False)
-                return
+        with contextlib.closing(self.race_mirrors(hit)) as urls:
+            for mirror, url in urls:
+                if self.download_url(hit, mirror, url):
+                    hit.work_path.rename(hit.path)
+                    if self.args.view:
+                        self.log.debug("Trying to open %s", hit.path)
+                        subprocess.run(["open", str(hit.path)], check=False)
+                    return True
 
         try:
             if hit.work_path.stat().st_size == 0:
@@ -404,29 +1066,69 @@ class LibgenDownload:
         )
         for nmirror, mirror in enumerate(hit.mirrors, 1):
             self.log.debug("Mirror %d: %s", nmirror, mirror)
+        return False
+
+    def race_mirrors(self, hit: Hit) -> Iterator[tuple[str, str]]:
+        """Read all mirror pages at once; yield (mirror, download URL), fastest first.
+
+        The mirror which did best before gets a head start of `PREFER_WAIT`
+        seconds. Closing the generator cancels the mirrors which haven't
+        answered.
+        """
+        scores = self.queue.health(hit.mirrors)
+        best = max(scores, key=scores.__getitem__, default=None)
+        pool = ThreadPoolExecutor(max_workers=max(len(hit.mirrors), 1))
+        try:
+            futures = {
+                pool.submit(self.read_mirror, mirror, self.MIRROR_TIMEOUT): mirror
+                for mirror in hit.mirrors
+            }
+            ahead = [future for future, mirror in futures.items() if mirror == best]
+            wait(ahead, timeout=self.PREFER_WAIT)
+            ahead = [future for future in ahead if future.done()]
+            behind = [future for future in futures if future not in ahead]
+            for future in itertools.chain(ahead, as_completed(behind)):
+                mirror = futures[future]
+                netloc = urlparse.urlsplit(mirror).netloc
+                try:
+                    url = future.result()
+                except (requests.exceptions.RequestException, WrongReplyError) as exc:
+                    self.log.debug("Mirror %s: %s", netloc, exc)
+                    self.queue.record(mirror, ok=False)
+                    continue
+                self.log.debug("Mirror: %s", netloc)
+                yield mirror, url
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
 
-    def download_mirror(self, hit: Hit, mirror: str) -> bool:
-        """Download one file from a specific mirror."""
-        self.log.debug("Mirror: %s", urlparse.urlsplit(mirror).netloc)
-
+    def download_url(self, hit: Hit, mirror: str, url: str) -> bool:
+        """Download one file from a specific mirror's URL."""
+        started = time.monotonic()
         try:
-            self.http.download(
+            nbytes = self.http.download(
+                [url],
                 progress=self.progress,
                 description=hit.name,
-                url=self.read_mirror(mirror),
                 path=hit.work_path,
                 overwrite=self.args.overwrite,
             )
         except (requests.exceptions.RequestException, WrongReplyError) as exc:
             self.log.debug("Error downloading: %s", exc)
+            self.queue.record(mirror, ok=False)
             return False
         else:
+            seconds = time.monotonic() - started
+            self.queue.record(mirror, ok=True, nbytes=nbytes, seconds=seconds)
             return True
 
-    def read_mirror(self, url: str) -> str:
+    def read_mirror(
+        self,
+        url: str,
+        timeout: float | tuple[float, float] | None = None,
+    ) -> str:
         """Read LibGen mirror page, return download URL."""
-        response = self.http.get(url)
-        soup = self.parse_html(response.text, "mirror")
+        response = self.http.race(url, timeout=timeout)
+        soup = self.parse_html(response.text, f"mirror-{urlparse.urlsplit(url).netloc}")
         atag = self.find_tag(soup, "a", string="GET")
         href = atag.get("href")
 
@@ -435,9 +1137,9 @@ class LibgenDownload:
 
         return urlparse.urljoin(url, href)
 
-    def parse_row(self, row: bs4.Tag, columns: list[str]) -> Hit:
+    def parse_row(self, row: bs4.Tag, columns: list[str], host: str) -> Hit:
         """Convert a query table row to a dict."""
-        cells = dict(zip(columns, row.find_all("td"), strict=True))
+        cells = dict(zip(columns, row.find_all("td", recursive=False), strict=True))
         if "Title" in cells:
             id_cell = IdCell(
                 lgid=int(self.parse_cell(cells["ID"])),
@@ -467,7 +1169,7 @@ class LibgenDownload:
         name = self.BAD_CHARS_RE.sub("-", name)
 
         mirrors = [
-            url for url in self.parse_mirrors_cell(cells["Mirrors"])
+            url for url in self.parse_mirrors_cell(cells["Mirrors"], host)
             if "annas-archive.org" not in url
         ]
         random.shuffle(mirrors)  # Keep them on their toes
@@ -517,9 +1219,9 @@ class LibgenDownload:
 
         return id_cell
 
-    def parse_mirrors_cell(self, cell: bs4.Tag) -> list[str]:
+    def parse_mirrors_cell(self, cell: bs4.Tag, host: str) -> list[str]:
         """Extract links from the Mirrors cell."""
-        base = f"https://{self.args.host}/"
+        base = f"https://{host}/"
         return [
             urlparse.urljoin(base, href)
             for link in cell.find_all("a")
@@ -539,12 +1241,17 @@ class LibgenDownload:
             raise WrongReplyError(f"No <{name}> in reply")
         return found
 
-    def parse_html(self, html: str, infix: str) -> bs4.BeautifulSoup:
+    def parse_html(
+        self,
+        html: str,
+        infix: str,
+        parse_only: bs4.SoupStrainer | None = None,
+    ) -> bs4.BeautifulSoup:
         """Debug-dumping wrapper around BeautifulSoup."""
         if self.args.debug and infix:
             with self.open_dump(infix, "html", "w") as fobj:
                 fobj.write(html)
-        return bs4.BeautifulSoup(html, "html.parser")
+        return bs4.BeautifulSoup(html, self.PARSER, parse_only=parse_only)
 
     def open_dump(self, infix: str, suffix: str, mode: str) -> t.IO:
         """Open a dump file created by `parse_html()`."""
@@ -564,6 +1271,15 @@ class FullMatch:  # pylint: disable=too-few-public-methods
         return value
 
 
+def byte_size(value: str) -> int:
+    """Parse "500K", "2M", "1.5G"... into bytes."""
+    mobj = re.fullmatch(r"(\d+(?:\.\d+)?)([KMG]?)B?", value.strip(), re.IGNORECASE)
+    if not mobj:
+        raise ValueError
+    power = " KMG".index(mobj.group(2).upper() or " ")
+    return int(float(mobj.group(1)) * 1000**power)
+
+
 @dataclass
 class Marquee:
     """A download marquee."""
@@ -635,8 +1351,105 @@ class DownloadProgress(rich.progress.Progress):
         return super().get_renderable()
 
 
+@dataclass
+class Segment:
+    """A byte range [start, end) of a download, of which `done` bytes are in."""
+
+    start: int
+    end: int
+    done: int = 0
+
+    @property
+    def pos(self) -> int:
+        """Where to continue."""
+        return self.start + self.done
+
+    @property
+    def complete(self) -> bool:
+        """Whether we have it all."""
+        return self.pos >= self.end
+
+
+class SegmentMap:
+    """Which parts of a segmented download we have, kept next to the file.
+
+    A `.lgdl` file is preallocated to its full size, so its size says
+    nothing about what's in it; this sidecar (`.lgdl.segments`, JSON)
+    does, and is saved every `SAVE_EVERY` seconds while downloading.
+    """
+
+    SAVE_EVERY = 1.0
+
+    def __init__(self, path: Path, size: int, segments: list[Segment]) -> None:
+        self.path = path
+        self.size = size
+        self.segments = segments
+        self.lock = threading.Lock()
+        self.saved_at = 0.0
+
+    @classmethod
+    def load(cls, path: Path, size: int) -> t.Self | None:
+        """Read the map of an interrupted download of `size` bytes, if any."""
+        try:
+            with path.open(encoding="utf-8") as fobj:
+                data = json.load(fobj)
+        except (OSError, ValueError):
+            return None
+        if data.get("size") != size:
+            return None
+        segments = [Segment(*segment) for segment in data["segments"]]
+        return cls(path, size, segments)
+
+    @classmethod
+    def split(cls, path: Path, size: int, count: int, got: int = 0) -> t.Self:
+        """Map `count` segments, the first `got` bytes of which we have."""
+        bounds = [size * nseg // count for nseg in range(count + 1)]
+        segments = [
+            Segment(start, end, min(max(got - start, 0), end - start))
+            for start, end in itertools.pairwise(bounds)
+        ]
+        return cls(path, size, segments)
+
+    @property
+    def got(self) -> int:
+        """How many bytes we have."""
+        return sum(segment.done for segment in self.segments)
+
+    def advance(self, segment: Segment, nbytes: int) -> None:
+        """Note that `nbytes` more of `segment` were written."""
+        with self.lock:
+            segment.done += nbytes
+            if time.monotonic() - self.saved_at >= self.SAVE_EVERY:
+                self._save()
+
+    def save(self) -> None:
+        """Write the map."""
+        with self.lock:
+            self._save()
+
+    def _save(self) -> None:
+        data = {
+            "size": self.size,
+            "segments": [
+                [segment.start, segment.end, segment.done]
+                for segment in self.segments
+            ],
+        }
+        tmp_path = self.path.with_name(f"{self.path.name}.tmp")
+        with tmp_path.open("w", encoding="utf-8") as fobj:
+            json.dump(data, fobj)
+        tmp_path.replace(self.path)
+        self.saved_at = time.monotonic()
+
+
 class Http:
-    """Wrapper+ for `requests.get()`."""
+    """Wrapper+ for a pooled `requests.Session`.
+
+    Connections are kept alive and reused, up to `pool_size` per host
+    (threads wait for a free one beyond that), and idempotent requests
+    are retried with exponential backoff on connection errors and on
+    `RETRY_STATUSES`; except in `race()`, which has its own session.
+    """
 
     DEFAULT_USER_AGENT = (
         "Mozilla/5.0 (X11; Linux x86_64) "
@@ -645,70 +1458,323 @@ class Http:
         "Chrome/87.0.4280.144 "
         "Safari/537.36"
     )
+    TIMEOUT = 60
+    RETRIES = 3
+    BACKOFF = 0.5  # Seconds, doubled after each retry
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    POOL_SIZE = 8  # Connections per host
+    CHUNK_SIZE = 1 << 20
+    MIN_SEGMENT = 4 << 20  # Not worth another connection for less
+    CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
     log: logging.Logger
 
     def __init__(
         self,
         user_agent: str | None = None,
         log: logging.Logger | None = None,
+        segments: int = 4,
+        rate: int | None = None,
     ) -> None:
         self.log = log or logging.getLogger()
         self.user_agent = user_agent or self.DEFAULT_USER_AGENT
+        self.segments = max(segments, 1)
+        self.throttle = Throttle(rate) if rate else None
         self.log.debug("User-Agent: %s", self.user_agent)
+        self.session = self.make_session(
+            requests.adapters.Retry(
+                total=self.RETRIES,
+                backoff_factor=self.BACKOFF,
+                status_forcelist=self.RETRY_STATUSES,
+                respect_retry_after_header=True,
+            ),
+        )
+        self.race_session = self.make_session(requests.adapters.Retry(0, read=False))
+
+    def make_session(self, retry: requests.adapters.Retry) -> requests.Session:
+        """Create a pooled session, which retries as `retry` says."""
+        session = requests.Session()
+        session.headers["User-Agent"] = self.user_agent
+        session.hooks["response"].append(self.log_response)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=max(self.POOL_SIZE, self.segments),
+            pool_block=True,
+            max_retries=retry,
+        )
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
 
-    def get(
+    def close(self) -> None:
+        """Close pooled connections."""
+        self.session.close()
+        self.race_session.close()
+
+    def log_response(
+        self,
+        response: requests.Response,
+        *_args: object,
+        **_kwargs: object,
+    ) -> None:
+        """Log how long until the headers of `response` were in."""
+        self.log.debug(
+            "%s %s: %d after %.0f ms",
+            response.request.method,
+            urlparse.urlsplit(response.url).netloc,
+            response.status_code,
+            response.elapsed.total_seconds() * 1000,
+        )
+
+    def log_throughput(self, url: str, nbytes: int, seconds: float) -> None:
+        """Log how fast a body came in."""
+        self.log.debug(
+            "%s: %s in %.1f s (%s/s)",
+            urlparse.urlsplit(url).netloc,
+            self.kbmbgb(nbytes),
+            seconds,
+            self.kbmbgb(int(nbytes / max(seconds, 1e-3))),
+        )
+
+    def get(  # pylint: disable=too-many-arguments
         self,
         url: str,
         pos: int = 0,
         *,
+        end: int | None = None,
         stream: bool = False,
+        timeout: float | tuple[float, float] | None = None,
     ) -> requests.Response:
         """Override parent."""
-        headers = {"User-Agent": self.user_agent}
-        if pos:
-            headers["Range"] = f"bytes={pos}-"
-        resp = requests.get(url, headers=headers, stream=stream, timeout=60)
+        headers = {}
+        if pos or end is not None:
+            headers["Range"] = f"bytes={pos}-{'' if end is None else end}"
+        resp = self.session.get(
+            url,
+            headers=headers,
+            stream=stream,
+            timeout=timeout or self.TIMEOUT,
+        )
         resp.raise_for_status()
         return resp
 
-    def download(  # pylint: disable=too-many-arguments
+    def race(
         self,
         url: str,
+        timeout: float | tuple[float, float] | None = None,
+    ) -> requests.Response:
+        """GET without retries, for when another server will do if this one fails.
+
+        Retrying would keep a slow server in a race up to `RETRIES` times
+        the timeout.
+        """
+        resp = self.race_session.get(url, timeout=timeout or self.TIMEOUT)
+        resp.raise_for_status()
+        return resp
+
+    def probe(self, url: str) -> int | None:
+        """Return the size of a file, if the server does ranges; else None."""
+        with self.get(url, end=0, stream=True) as response:
+            if response.status_code != requests.codes.partial_content:
+                return None
+            mobj = self.CONTENT_RANGE_RE.fullmatch(
+                response.headers.get("content-range", ""),
+            )
+        return int(mobj.group(3)) if mobj else None
+
+    def range_start(self, response: requests.Response) -> int | None:
+        """Return where the body of a 206 reply starts; None if not a 206."""
+        if response.status_code != requests.codes.partial_content:
+            return None
+        mobj = self.CONTENT_RANGE_RE.fullmatch(
+            response.headers.get("content-range", ""),
+        )
+        return int(mobj.group(1)) if mobj else None
+
+    def download(
+        self,
+        urls: Sequence[str],
         *,
         path: Path,
         overwrite: bool,
         progress: rich.progress.Progress,
         description: str,
-    ) -> None:
-        """Download a file."""
+    ) -> int:
+        """Download a file from `urls[0]`; in segments (from all `urls`) if we can.
+
+        Return how many bytes we fetched (less than the size, if resuming).
+        """
+        if overwrite:
+            path.unlink(missing_ok=True)
+            self.segments_path(path).unlink(missing_ok=True)
         task_id = progress.add_task(description)
         try:
             progress.console.log(description)
-
-            with path.open("wb" if overwrite else "ab") as fobj:
-                got = fobj.tell()
-                if got > 0:
-                    self.log.debug("Resuming at %s", self.kbmbgb(got))
-                    progress.update(task_id, completed=got, total=got * 2)
-
-                response = self.get(url, pos=got, stream=True)
-                size = got + int(response.headers.get("content-length", 0))
-                progress.update(task_id, total=size, completed=got)
-                for chunk in response.iter_content():
-                    progress.update(task_id, advance=len(chunk))
-                    fobj.write(chunk)
-
-                got = fobj.tell()
-
-            if got < size:
-                raise WrongReplyError(
-                    f"File terminated prematurely ("
-                    f"{self.kbmbgb(got)} < "
-                    f"{self.kbmbgb(size)}",
+            size = self.probe(urls[0])
+            if size is None:
+                self.log.debug("No ranges, downloading in one piece")
+                return self.download_stream(
+                    urls[0],
+                    path=path,
+                    progress=progress,
+                    task_id=task_id,
                 )
+            return self.download_segments(
+                urls,
+                size=size,
+                path=path,
+                progress=progress,
+                task_id=task_id,
+            )
         finally:
             progress.stop_task(task_id)
 
+    def download_stream(
+        self,
+        url: str,
+        *,
+        path: Path,
+        progress: rich.progress.Progress,
+        task_id: rich.progress.TaskID,
+    ) -> int:
+        """Download a file in one request, resuming at the end of `path`.
+
+        If the server ignores the `Range` (answers 200, with all of the
+        file), the partial file is discarded and we start over.
+        """
+        map_path = self.segments_path(path)
+        if map_path.exists():  # Preallocated, so its end is not where we are
+            map_path.unlink()
+            path.unlink(missing_ok=True)
+        with path.open("ab") as fobj:
+            got = fobj.tell()
+            if got > 0:
+                self.log.debug("Resuming at %s", self.kbmbgb(got))
+                progress.update(task_id, completed=got, total=got * 2)
+
+            started = time.monotonic()
+            response = self.get(url, pos=got, stream=True)
+            if got > 0 and self.range_start(response) != got:
+                self.log.debug("Range ignored, starting over")
+                fobj.seek(0)
+                fobj.truncate()
+                got = 0
+            size = got + int(response.headers.get("content-length", 0))
+            progress.update(task_id, total=size, completed=got)
+            for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                progress.update(task_id, advance=len(chunk))
+                fobj.write(chunk)
+                if self.throttle:
+                    self.throttle(len(chunk))
+
+            fetched = fobj.tell() - got
+            self.log_throughput(url, fetched, time.monotonic() - started)
+            got = fobj.tell()
+
+        if got < size:
+            raise WrongReplyError(
+                f"File terminated prematurely ("
+                f"{self.kbmbgb(got)} < "
+                f"{self.kbmbgb(size)}",
+            )
+        return fetched
+
+    def download_segments(
+        self,
+        urls: Sequence[str],
+        *,
+        size: int,
+        path: Path,
+        progress: rich.progress.Progress,
+        task_id: rich.progress.TaskID,
+    ) -> int:
+        """Download ranges of a file concurrently, into a preallocated file."""
+        map_path = self.segments_path(path)
+        segmap = SegmentMap.load(map_path, size)
+        if segmap is None:
+            # Maybe a partial download from before we did segments
+            got = path.stat().st_size if path.is_file() else 0
+            count = min(self.segments, max((size - got) // self.MIN_SEGMENT, 1))
+            segmap = SegmentMap.split(map_path, size, count, got if got < size else 0)
+        else:
+            self.log.debug("Resuming at %s", self.kbmbgb(segmap.got))
+        with path.open("r+b" if path.is_file() else "w+b") as fobj:
+            fobj.truncate(size)  # Sparse, where the file system can
+        segmap.save()
+        progress.update(task_id, total=size, completed=segmap.got)
+        got = segmap.got
+
+        pending = [segment for segment in segmap.segments if not segment.complete]
+        self.log.debug("%d segment(s) from %d URL(s)", len(pending), len(urls))
+        errors = []
+        with ThreadPoolExecutor(max_workers=max(len(pending), 1)) as pool:
+            futures = [
+                pool.submit(
+                    self.download_segment,
+                    urls[nseg % len(urls)],
+                    segmap=segmap,
+                    segment=segment,
+                    path=path,
+                    advance=lambda nbytes: progress.update(task_id, advance=nbytes),
+                )
+                for nseg, segment in enumerate(pending)
+            ]
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except (requests.exceptions.RequestException, WrongReplyError) as exc:
+                    self.log.debug("Segment failed: %s", exc)
+                    errors.append(exc)
+        segmap.save()
+
+        if errors:
+            raise errors[0]
+        if segmap.got < size:
+            raise WrongReplyError(
+                f"File terminated prematurely ("
+                f"{self.kbmbgb(segmap.got)} < "
+                f"{self.kbmbgb(size)}",
+            )
+        map_path.unlink(missing_ok=True)
+        return size - got
+
+    @staticmethod
+    def segments_path(path: Path) -> Path:
+        """Where the `SegmentMap` of a download into `path` is kept."""
+        return path.with_name(f"{path.name}.segments")
+
+    def download_segment(
+        self,
+        url: str,
+        *,
+        segmap: SegmentMap,
+        segment: Segment,
+        path: Path,
+        advance: t.Callable[[int], object],
+    ) -> None:
+        """Download what's missing of one segment."""
+        started = time.monotonic()
+        got = segment.done
+        with self.get(url, segment.pos, end=segment.end - 1, stream=True) as response:
+            mobj = self.CONTENT_RANGE_RE.fullmatch(
+                response.headers.get("content-range", ""),
+            )
+            if not mobj or int(mobj.group(1)) != segment.pos:
+                raise WrongReplyError(f"Range ignored by {url}")
+            if int(mobj.group(3)) != segmap.size:
+                raise WrongReplyError(f"Different file at {url}")
+
+            with path.open("r+b") as fobj:
+                fobj.seek(segment.pos)
+                for chunk in response.iter_content(chunk_size=self.CHUNK_SIZE):
+                    data = chunk[:segment.end - segment.pos]
+                    fobj.write(data)
+                    segmap.advance(segment, len(data))
+                    advance(len(data))
+                    if self.throttle:
+                        self.throttle(len(data))
+                    if segment.complete:
+                        break
+        self.log_throughput(url, segment.done - got, time.monotonic() - started)
+
     @staticmethod
     def kbmbgb(num: float) -> str:
         """Format a number as "932K", etc."""
@@ -724,5 +1790,22 @@ class Http:
         return f"{num:,.1f}{prefixes[-1]}"
 
 
+class Throttle:  # pylint: disable=too-few-public-methods
+    """Keep the total rate of all threads' downloads under `rate` bytes/s."""
+
+    def __init__(self, rate: int) -> None:
+        self.rate = rate
+        self.lock = threading.Lock()
+        self.due = time.monotonic()
+
+    def __call__(self, nbytes: int) -> None:
+        """Account for `nbytes` just read; sleep until we may read more."""
+        with self.lock:
+            now = time.monotonic()
+            self.due = max(self.due, now) + nbytes / self.rate
+            delay = self.due - now
+        time.sleep(delay)
+
+
 if __name__ == "__main__":
     LibgenDownload().run()
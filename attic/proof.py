@@ -12,7 +12,6 @@ import subprocess
 import typing as t
 from collections import Counter
 from collections import defaultdict
-from copy import deepcopy
 from pathlib import Path
 
 from lxml import etree
@@ -294,33 +293,27 @@ class Proof(DocxWorker):
                 self._count("italicized in full")
                 continue
 
-            # This is the difficult case: Need to create duplicates
+            # This is the difficult case: Need to split the run
+            pieces: list[tuple[str, str | None]] = []
             idx_prev = 0
             for match in re.finditer(self.ITALICABLE_RE, text):
                 (idx_from, idx_to) = match.span()
                 if idx_prev < idx_from:
-                    addend = self._mknode(
-                        rnode,
-                        text[idx_prev:idx_from],
-                        italic=False,
-                    )
-                    rnode.addprevious(addend)
-                    self._count("non-italicized part", addend)
+                    pieces.append((text[idx_prev:idx_from], None))
                 if idx_from < idx_to:
-                    addend = self._mknode(
-                        rnode,
-                        text[idx_from:idx_to],
-                        italic=True,
-                    )
-                    rnode.addprevious(addend)
-                    self._count("italicized part", addend)
-                    self._count(self.TOTAL_ITALICIZED_KEY)
+                    pieces.append((text[idx_from:idx_to], "i"))
                 idx_prev = idx_to
             if idx_prev < len(text):
-                addend = self._mknode(rnode, text[idx_prev:], italic=False)
-                rnode.addprevious(addend)
-                self._count("non-italicized part", addend)
-            rnode.getparent().remove(rnode)
+                pieces.append((text[idx_prev:], None))
+
+            for (_, extra_tag), addend in zip(
+                pieces, self.split_rnode(rnode, pieces), strict=True,
+            ):
+                if extra_tag is None:
+                    self._count("non-italicized part", addend)
+                else:
+                    self._count("italicized part", addend)
+                    self._count(self.TOTAL_ITALICIZED_KEY)
 
         return self.counts[self.TOTAL_ITALICIZED_KEY] > 0
 
@@ -480,28 +473,6 @@ class Proof(DocxWorker):
         self.formula_style_id = formula_style_id
         return True
 
-    def _mknode(
-        self, model: etree._Entity,
-        text: str,
-        *,
-        italic: bool,
-    ) -> etree._Entity:
-        """Create a duplicate of `model` with different text."""
-        rnode = deepcopy(model)
-        self._set_rnode_text(rnode, text)
-        if italic:
-            self._add_to_rprops(rnode, "i")
-        return rnode
-
-    def _set_rnode_text(self, rnode: etree._Entity, text: str) -> None:
-        """Replace <w:t> inside <w:r>."""
-        tnode = self._find(rnode, "w:t")
-        tnode.text = text
-        if text[0].isspace() or text[-1].isspace():
-            tnode.set(
-                "{http://www.w3.org/XML/1998/namespace}space", "preserve",
-            )
-
     def _count(self, key: str, node: etree._Entity | None = None) -> None:
         """Save a comment to be postracted."""
         self.counts[key] += 1
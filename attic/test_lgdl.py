@@ -0,0 +1,275 @@
+#!/usr/bin/env -S uvx pytest -v
+# ruff: noqa: D100, D101, D102, D103
+# ty: ignore[unresolved-import]
+import argparse
+import http.server
+import logging
+import re
+import tempfile
+import threading
+import typing as t
+from pathlib import Path
+
+import pytest
+import requests
+import rich.progress
+
+from . import lgdl
+
+DATA = bytes(range(256)) * 4096  # 1M
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    ranges = True
+    failures = 0  # How many requests for /flaky fail before one works
+    clients: t.ClassVar[list[tuple[str, int]]] = []
+
+    def log_message(self, *_args: object) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        self.clients.append(self.client_address)
+        if self.path == "/flaky" and Handler.failures > 0:
+            Handler.failures -= 1
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path.startswith("/page/"):  # A mirror page
+            body = b'<html><body><a href="/file">GET</a></body></html>'
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        mobj = re.fullmatch(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if mobj and self.ranges:
+            start = int(mobj.group(1))
+            end = int(mobj.group(2)) if mobj.group(2) else len(DATA) - 1
+            body = DATA[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(DATA)}")
+        else:
+            body = DATA
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server() -> t.Generator[str]:
+    Handler.ranges = True
+    Handler.failures = 0
+    Handler.clients = []
+    httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_port}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.fixture
+def tdir() -> t.Generator[Path]:
+    with tempfile.TemporaryDirectory() as tdir:
+        yield Path(tdir)
+
+
+def download(http: lgdl.Http, url: str, path: Path) -> int:
+    with rich.progress.Progress(disable=True) as progress:
+        return http.download(
+            [url],
+            path=path,
+            overwrite=False,
+            progress=progress,
+            description=path.name,
+        )
+
+
+def test_download_segments(server: str, tdir: Path) -> None:
+    path = tdir / "file.lgdl"
+    assert download(lgdl.Http(segments=4), f"{server}/file", path) == len(DATA)
+    assert path.read_bytes() == DATA
+    assert not lgdl.Http.segments_path(path).exists()
+
+
+def test_resume_segments(server: str, tdir: Path) -> None:
+    path = tdir / "file.lgdl"
+    path.write_bytes(DATA[:1000])
+    assert download(lgdl.Http(), f"{server}/file", path) == len(DATA) - 1000
+    assert path.read_bytes() == DATA
+
+
+def test_no_ranges_starts_over(server: str, tdir: Path) -> None:
+    Handler.ranges = False
+    path = tdir / "file.lgdl"
+    path.write_bytes(b"partial")
+    download(lgdl.Http(), f"{server}/file", path)
+    assert path.read_bytes() == DATA
+
+
+def make_hit(lgid: int, title: str, folder: Path) -> lgdl.Hit:
+    return lgdl.Hit(
+        title=title,
+        lgid=lgid,
+        authors="Tolstoy, Leo",
+        name=f"{title}.epub",
+        path=folder / f"{title}.epub",
+        work_path=folder / f"libgen-{lgid}.lgdl",
+        resume=False,
+        language="English",
+        size_desc="1 MB",
+        publisher="Penguin",
+        year="2001",
+        pages="",
+        mirrors=[f"http://mirror/{lgid}"],
+    )
+
+
+@pytest.fixture
+def hit_cache(tdir: Path) -> t.Generator[lgdl.HitCache]:
+    hit_cache = lgdl.HitCache(tdir / "hits.sqlite")
+    yield hit_cache
+    hit_cache.close()
+
+
+KEY = ("tolstoy", "tai", "fl", "f")
+
+
+def test_hit_cache(hit_cache: lgdl.HitCache, tdir: Path) -> None:
+    hits = [make_hit(1, "War and Peace", tdir), make_hit(2, "Anna Karenina", tdir)]
+    hit_cache.put("libgen.gs", KEY, hits)
+    assert hit_cache.get("libgen.gs", KEY, 3600) == hits
+    assert hit_cache.get("libgen.is", KEY, 3600) is None
+    assert hit_cache.get("libgen.gs", KEY, -1) is None  # Too old
+    assert [hit.lgid for hit in hit_cache.search("anna pengu")] == [2]
+
+
+def test_no_hits_not_cached(hit_cache: lgdl.HitCache, tdir: Path) -> None:
+    app = lgdl.LibgenDownload()
+    app.log = logging.getLogger("test")
+    app.args = argparse.Namespace(
+        hosts=["libgen.gs"],
+        fields="tai",
+        topics="fl",
+        contents="f",
+        reload=False,
+        debug=False,
+        max_age=24,
+        output=tdir,
+        overwrite=False,
+    )
+    app.query = "tolstoy"
+    app.hit_cache = hit_cache
+    replies = []
+    app.get_query_reply = lambda host: replies.append(host) or "<html/>"  # type: ignore[method-assign]
+
+    assert list(app.get_host_hits()) == [("libgen.gs", [])]  # Captcha, say
+    assert list(app.get_host_hits()) == [("libgen.gs", [])]
+    assert replies == ["libgen.gs", "libgen.gs"]
+
+
+@pytest.fixture
+def queue(tdir: Path) -> t.Generator[lgdl.DownloadQueue]:
+    queue = lgdl.DownloadQueue(tdir / "queue" / "queue.sqlite")
+    yield queue
+    queue.close()
+
+
+def test_queue_resolves_paths(
+    queue: lgdl.DownloadQueue,
+    tdir: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.chdir(tdir)
+    assert queue.add(make_hit(1, "War and Peace", Path("libgen")))
+    (item,) = queue.claim(1)
+    assert item.hit.path == tdir / "libgen" / "War and Peace.epub"
+    assert item.hit.work_path == tdir / "libgen" / "libgen-1.lgdl"
+
+
+def test_queue_skips_active_and_done(queue: lgdl.DownloadQueue, tdir: Path) -> None:
+    hit = make_hit(1, "War and Peace", tdir)
+    assert queue.add(hit)
+    assert queue.add(hit)  # Still just queued
+    (item,) = queue.claim(1)
+    assert not queue.add(hit)
+    queue.finish(item, done=True)
+    assert not queue.add(hit)
+    assert queue.add(hit, again=True)
+
+
+def test_queue_retries(queue: lgdl.DownloadQueue, tdir: Path) -> None:
+    queue.add(make_hit(1, "War and Peace", tdir))
+    delays = []
+    while item := queue.claim(1):
+        delays.append(queue.finish(item[0], done=False))
+        queue.db.execute("UPDATE queue SET next_try = 0 WHERE state = 'queued'")
+    assert delays == [60, 120, 240, 480, 960, 1920, 3840, None]
+    assert [state for state, *_ in queue.items()] == ["failed"]
+    assert queue.next_try() is None
+
+
+def make_worker(queue: lgdl.DownloadQueue) -> lgdl.LibgenDownload:
+    app = lgdl.LibgenDownload()
+    app.log = logging.getLogger("test")
+    app.args = argparse.Namespace(jobs=2, view=False, overwrite=False, debug=False)
+    app.http = lgdl.Http(log=app.log)
+    app.queue = queue
+    return app
+
+
+def test_worker(server: str, queue: lgdl.DownloadQueue, tdir: Path) -> None:
+    for lgid in [1, 2]:
+        hit = make_hit(lgid, f"Book {lgid}", tdir)
+        hit.mirrors = [f"{server}/page/{lgid}"]
+        queue.add(hit)
+    make_worker(queue).run_worker()
+    assert [state for state, *_ in queue.items()] == ["done", "done"]
+    assert (tdir / "Book 2.epub").read_bytes() == DATA
+
+
+def test_worker_takes_late_item(
+    server: str,
+    queue: lgdl.DownloadQueue,
+    tdir: Path,
+) -> None:
+    app = make_worker(queue)
+    work_queue = app.work_queue
+    late = make_hit(1, "Late", tdir)
+    late.mirrors = [f"{server}/page/1"]
+
+    def work_queue_then_enqueue() -> None:
+        work_queue()
+        if not queue.items():  # Queued right after the worker's last look
+            queue.add(late)
+
+    app.work_queue = work_queue_then_enqueue  # type: ignore[method-assign]
+    app.run_worker()
+    assert (tdir / "Late.epub").read_bytes() == DATA
+
+
+def test_keep_alive(server: str) -> None:
+    http = lgdl.Http()
+    gets = 3
+    for _ in range(gets):
+        http.get(f"{server}/file", end=9)
+    http.close()
+    assert len(Handler.clients) == gets
+    assert len(set(Handler.clients)) == 1
+
+
+def test_get_retries(server: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(lgdl.Http, "BACKOFF", 0)
+    failures = Handler.failures = 2
+    assert lgdl.Http().get(f"{server}/flaky").content == DATA
+    assert len(Handler.clients) == failures + 1
+
+
+def test_race_does_not_retry(server: str) -> None:
+    Handler.failures = 1
+    with pytest.raises(requests.HTTPError):
+        lgdl.Http().race(f"{server}/flaky")
+    assert len(Handler.clients) == 1
@@ -7,6 +7,9 @@ from pathlib import Path
 
 from wp2tt.docx import DocxInput
 
+from hebrew_lexicon import PREFIXES
+from hebrew_lexicon import HebrewLexicon
+
 _NIQQ = "\u05B0-\u05BC\u05C1\u05C2"
 _ALPH = "\u05D0-\u05EA"
 _OTHR = "\u05F3"
@@ -61,8 +64,7 @@ def main() -> None:
     else:
         wpids = None
 
-    with Path("hebrew.words").open(encoding="utf-8") as fobj:
-        hebrew = {line.split("\t")[0] for line in fobj if "\t" in line}
+    hebrew = HebrewLexicon.from_words_file(Path("hebrew.words"))
 
     wrd2niqs = defaultdict(set)
     missing = set()
@@ -79,12 +81,12 @@ def main() -> None:
             if wrd == niq:
                 continue
 
-            if niq not in hebrew and niq.removeprefix("וְ") not in hebrew:
+            if not hebrew.known(niq, prefixes=["וְ"]):
                 missing.add(niq)
 
             wrd2niqs[wrd].add(niq)
 
-            for prefix in ["הַ", "וּ", "וְ", "שֶׁ"]:
+            for prefix in PREFIXES:
                 if niq.startswith(prefix):
                     stem = niq[len(prefix) :]
                     nniq = f"({prefix}){stem}"
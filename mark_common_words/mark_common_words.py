@@ -1,6 +1,9 @@
 # -*- coding: utf-8 -*-
 import os
 import gzip
+import mmap
+import struct
+import time
 try:
     import cPickle as pickle
 except ImportError:
@@ -11,6 +14,9 @@ except ImportError:
     from xml.etree import ElementTree as ET
 
 from anki.hooks import addHook
+from anki.utils import fieldChecksum, ids2str, intTime, joinFields, splitFields
+from anki.utils import stripHTMLMedia
+from aqt.utils import tooltip
 import aqt
 
 
@@ -18,41 +24,307 @@ THIS = __file__
 HERE = os.path.dirname(THIS)
 JMDICT_GZ = os.path.join(HERE, 'JMdict_e.gz')
 COMMON_WORDS_PICKLE = os.path.join(HERE, 'common_words.pickle')
-WORD_PRIOS_PICKLE = os.path.join(HERE, 'word_prios.pickle')
-PICKLE_PROTOCOL = 2  # Highest supported by Python 2.x
+WORD_PRIOS_PICKLE = os.path.join(HERE, 'word_prios.pickle')  # Used if no JMdict
+WORD_PRIOS_TABLE = os.path.join(HERE, 'word_prios.table')
+
+# One bit each, in this order; changing it means changing PrioTable.MAGIC.
+# 'kana' is ours: the word is only ever a reading, and has its re_pri tags.
+NF_TAGS = tuple('nf%02d' % nn for nn in range(1, 49))
+PRIO_TAGS = (
+    ('news1', 'news2', 'ichi1', 'ichi2', 'spec1', 'spec2', 'gai1', 'gai2') +
+    NF_TAGS +
+    ('kana',)
+)
+PRIO_BITS = dict((tag, 1 << bit) for bit, tag in enumerate(PRIO_TAGS))
+
+# Commonness of a word: the sum of the scores of its tags (nf01 is the
+# top 500 words of the newspaper corpus, nf48 the last 500 of 24000);
+# saved in the table, so changing these means changing PrioTable.MAGIC
+TAG_SCORES = dict(
+    [('news1', 20), ('news2', 10), ('ichi1', 20), ('ichi2', 10),
+     ('spec1', 15), ('spec2', 10), ('gai1', 15), ('gai2', 5)] +
+    [(tag, 49 - nn) for nn, tag in enumerate(NF_TAGS, 1)]
+)
 
 # COMMON_PRIOS = ('news1', 'ichi1', 'spec1', 'spec2')
 # COMMON_PRIOS = ('spec1', 'spec2', 'nf01', 'nf02', 'nf03', 'nf04')
 # COMMON_PRIOS = ('nf01', 'nf02', 'nf03', 'nf04')
 COMMON_PRIOS = ('nf01', 'nf02')
 
-word_to_prios = None
+PROGRESS_EVERY = 1000  # Notes
+
+prio_table = None
+
+
+class PrioTable(object):
+    """JMdict forms and their priority tags, in a memory-mapped file.
+
+    Layout (native byte order): header, offsets of the sorted UTF-8 words
+    in the blob (uint32, one more than words), a bitmask of PRIO_TAGS
+    per word (uint64), a score per word (uint16, see TAG_SCORES), the
+    blob. Lookups binary-search the mapping, so opening is instant and
+    nothing gets loaded.
+    """
+
+    MAGIC = b'EVJMPT04'
+    HEADER = struct.Struct('=8sQQI4x')  # magic, JMdict mtime, JMdict size, count
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.mtime, self.size, self.count = self.HEADER.unpack_from(self.data)
+        if magic != self.MAGIC:
+            raise ValueError('%s is not a priority table' % path)
+        self.offsets_at = self.HEADER.size
+        self.masks_at = self.offsets_at + 4 * (self.count + 1)
+        self.scores_at = self.masks_at + 8 * self.count
+        self.blob_at = self.scores_at + 2 * self.count
+
+    def is_for(self, stamp):
+        return (self.mtime, self.size) == stamp
+
+    def _word(self, idx):
+        start, end = struct.unpack_from('=II', self.data, self.offsets_at + 4 * idx)
+        return self.data[self.blob_at + start:self.blob_at + end]
+
+    def _index(self, word):
+        needle = word.encode('utf-8')
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._word(mid) < needle:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == self.count or self._word(lo) != needle:
+            return None
+        return lo
+
+    def mask(self, word):
+        """Return the bitmask of the priority tags of `word` (0 if none)."""
+        idx = self._index(word)
+        if idx is None:
+            return 0
+        return struct.unpack_from('=Q', self.data, self.masks_at + 8 * idx)[0]
+
+    def lookup(self, word):
+        """Return (mask, score) of `word`; (0, 0) if not in JMdict."""
+        idx = self._index(word)
+        if idx is None:
+            return 0, 0
+        mask = struct.unpack_from('=Q', self.data, self.masks_at + 8 * idx)[0]
+        score = struct.unpack_from('=H', self.data, self.scores_at + 2 * idx)[0]
+        return mask, score
+
+    def scores(self):
+        """Return the scores of all words (in word order)."""
+        return struct.unpack_from('=%dH' % self.count, self.data, self.scores_at)
 
+    def masks(self):
+        """Return the bitmasks of all words (in word order)."""
+        return struct.unpack_from('=%dQ' % self.count, self.data, self.masks_at)
 
-def get_word_to_prios():
-    global word_to_prios
-    if word_to_prios:
-        return word_to_prios
+    def prios(self, word):
+        return self.tags(self.mask(word))
+
+    def nf(self, word):
+        """Return the nfXX frequency bucket of `word` (1-48), or None."""
+        mask = self.mask(word)
+        for nn, tag in enumerate(NF_TAGS, 1):
+            if mask & PRIO_BITS[tag]:
+                return nn
+        return None
+
+    def items(self):
+        """Yield all (word, mask), in order."""
+        for idx in range(self.count):
+            mask = struct.unpack_from('=Q', self.data, self.masks_at + 8 * idx)[0]
+            yield self._word(idx).decode('utf-8'), mask
+
+    @staticmethod
+    def tags(mask):
+        return [tag for tag in PRIO_TAGS if mask & PRIO_BITS[tag]]
+
+    @staticmethod
+    def mask_of(prios):
+        mask = 0
+        for prio in prios:
+            mask |= PRIO_BITS.get(prio, 0)
+        return mask
+
+    @classmethod
+    def score_of(cls, mask):
+        return sum(TAG_SCORES.get(tag, 0) for tag in cls.tags(mask))
+
+    @classmethod
+    def build(cls, path, word_to_mask, stamp=(0, 0)):
+        items = sorted(
+            (word.encode('utf-8'), mask) for word, mask in word_to_mask.items()
+        )
+        blob = b''.join(word for word, _ in items)
+        offsets = [0]
+        for word, _ in items:
+            offsets.append(offsets[-1] + len(word))
+
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(cls.HEADER.pack(cls.MAGIC, stamp[0], stamp[1], len(items)))
+            f.write(struct.pack('=%dI' % len(offsets), *offsets))
+            f.write(struct.pack('=%dQ' % len(items), *[mask for _, mask in items]))
+            f.write(struct.pack(
+                '=%dH' % len(items), *[cls.score_of(mask) for _, mask in items]))
+            f.write(blob)
+        os.rename(tmp_path, path)  # Not os.replace: this may still be Python 2
+
+
+def jmdict_stamp():
+    stat = os.stat(JMDICT_GZ)
+    return (int(stat.st_mtime), stat.st_size)
+
+
+def get_prio_table():
+    """Open word_prios.table, (re)building it if JMdict_e.gz has changed."""
+    global prio_table
+    if prio_table:
+        return prio_table
+
+    stamp = jmdict_stamp() if os.path.isfile(JMDICT_GZ) else None
+    if os.path.isfile(WORD_PRIOS_TABLE):
+        try:
+            table = PrioTable(WORD_PRIOS_TABLE)
+        except ValueError:
+            table = None  # Older format
+        else:
+            if stamp is None or table.is_for(stamp):
+                prio_table = table
+                return prio_table
+            table.data.close()
 
-    if os.path.isfile(WORD_PRIOS_PICKLE):
+    word_to_mask = {}
+    if stamp is None:
         with open(WORD_PRIOS_PICKLE, 'rb') as pickled:
-            word_to_prios = pickle.load(pickled)
-        return word_to_prios
+            for word, prios in pickle.load(pickled).items():
+                word_to_mask[word] = PrioTable.mask_of(prios)
+        stamp = (0, 0)
+    else:
+        # A kanji form keeps its own tags, even if it is also a reading
+        # (of another entry): only reading-only words get 'kana'
+        kanji_forms = {}
+        for word, mask in read_jmdict():
+            forms = word_to_mask if mask & PRIO_BITS['kana'] else kanji_forms
+            forms[word] = forms.get(word, 0) | mask
+        word_to_mask.update(kanji_forms)
+    if os.path.isfile(WORD_PRIOS_TABLE):
+        os.unlink(WORD_PRIOS_TABLE)  # For Windows, which cannot replace it
+    PrioTable.build(WORD_PRIOS_TABLE, word_to_mask, stamp)
+    prio_table = PrioTable(WORD_PRIOS_TABLE)
+    return prio_table
 
-    jmdict = ET.parse(gzip.GzipFile(JMDICT_GZ)).getroot()
-    word_to_prios = {
-        k_ele.find('keb').text: [ke_pri.text for ke_pri in k_ele.iter('ke_pri')]
-        for k_ele in jmdict.iterfind('entry/k_ele[ke_pri][keb]')
-    }
 
-    with open(WORD_PRIOS_PICKLE, 'wb') as pickled:
-        pickle.dump(word_to_prios, pickled, PICKLE_PROTOCOL)
-    return word_to_prios
+def read_jmdict():
+    """Yield (word, mask) for JMdict's kanji forms and readings with priorities.
 
+    Streams: each entry is dropped once read, so this never holds more
+    than one in memory.
+    """
+    kana = PRIO_BITS['kana']
+    with gzip.GzipFile(JMDICT_GZ) as fobj:
+        root = None
+        for event, elem in ET.iterparse(fobj, events=('start', 'end')):
+            if root is None:
+                root = elem
+            if event != 'end' or elem.tag != 'entry':
+                continue
+            for k_ele in elem.iter('k_ele'):
+                mask = PrioTable.mask_of(p.text for p in k_ele.iter('ke_pri'))
+                if mask:
+                    yield k_ele.findtext('keb'), mask
+            for r_ele in elem.iter('r_ele'):
+                mask = PrioTable.mask_of(p.text for p in r_ele.iter('re_pri'))
+                if mask:
+                    yield r_ele.findtext('reb'), mask | kana
+            root.clear()
 
-def is_common(word):
-    prios = get_word_to_prios().get(word)
-    return prios and any(prio in prios for prio in COMMON_PRIOS)
+
+def count_common(policy=None):
+    """How many words `policy` would mark (no reparsing)."""
+    policy = policy or POLICY
+    table = get_prio_table()
+    return sum(
+        1 for mask, score in zip(table.masks(), table.scores())
+        if policy.is_common_entry(table, mask, score)
+    )
+
+
+class Policy(object):
+    """Which words are common, and which frequency band each word is in.
+
+    A word is common if it has any of `prios`, or if its score is at
+    least `threshold`, and among the `top` best scores in JMdict (either
+    or both). `bands` are (min_score, tag) pairs: the word is in the
+    band of the first one its score reaches. Words which are only ever
+    readings (with the 'kana' bit) are neither common nor in a band
+    unless `kana`, as before the table had them; a kanji form is judged
+    by its own tags either way. Policies only read the table, so
+    switching needs no rebuild.
+    """
+
+    def __init__(self, prios=(), threshold=None, top=None, bands=(), kana=False):
+        self.mask = PrioTable.mask_of(prios)
+        self.threshold = threshold
+        self.top = top
+        self.bands = sorted(bands, reverse=True)
+        self.band_tags = set(tag for _, tag in self.bands)
+        self.skip = 0 if kana else PRIO_BITS['kana']
+        self._min_score = None
+
+    def min_score(self, table):
+        """Return the lowest score which is common, or None."""
+        if self._min_score is None:
+            min_scores = []
+            if self.threshold is not None:
+                min_scores.append(self.threshold)
+            if self.top:
+                scores = sorted(
+                    (score for mask, score in zip(table.masks(), table.scores())
+                     if not mask & self.skip),
+                    reverse=True)
+                if scores:
+                    min_scores.append(max(scores[min(self.top, len(scores)) - 1], 1))
+            self._min_score = max(min_scores) if min_scores else False
+        return self._min_score
+
+    def is_common(self, table, word):
+        mask, score = table.lookup(word)
+        return self.is_common_entry(table, mask, score)
+
+    def is_common_entry(self, table, mask, score):
+        """Whether a word with this `mask` and `score` is common."""
+        if mask & self.skip:
+            return False
+        if mask & self.mask:
+            return True
+        min_score = self.min_score(table)
+        return min_score is not False and score >= min_score
+
+    def band(self, table, word):
+        """Return the tag of the band of `word`, or None."""
+        mask, score = table.lookup(word)
+        if mask & self.skip:
+            return None
+        for min_score, tag in self.bands:
+            if score >= min_score:
+                return tag
+        return None
+
+
+# POLICY = Policy(threshold=60)
+# POLICY = Policy(top=5000, bands=[(60, 'freq1'), (40, 'freq2'), (20, 'freq3')])
+POLICY = Policy(prios=COMMON_PRIOS)
+
+
+def is_common(word, policy=None):
+    return (policy or POLICY).is_common(get_prio_table(), word)
 
 
 def add_browser_menu_entry(browser):
@@ -68,35 +340,108 @@ def bulk_mark_important_word(browser):
     mark_important_word(browser.selectedNotes())
 
 
-def mark_important_word(nids):
+def mark_important_word(nids, progress=None, policy=None):
+    """Set ImportantWord to '1' or '' on notes of common (or not) words.
+
+    Also tags each note with its frequency band, if the policy has any.
+    Reads the notes in one query, and writes (only those which change)
+    in one `executemany`, rather than loading and flushing each note;
+    then does in bulk what `Note.flush` would have: registers the tags,
+    and generates cards (templates may depend on ImportantWord).
+    """
+    policy = policy or POLICY
+    col = aqt.mw.col
     aqt.mw.checkpoint("Bulk mark ImportantWord")
-    aqt.mw.progress.start()
-    for nid in nids:
-        note = aqt.mw.col.getNote(nid)
-        if "japanese" not in note.model()['name'].lower():
-            continue
+    aqt.mw.progress.start(max=len(nids), label="Marking ImportantWord...")
+    t0 = time.time()
+    try:
+        rows = col.db.all(
+            "select id, mid, flds, tags from notes where id in %s" % ids2str(nids))
+        updates = important_word_updates(
+            col, rows, policy, progress or show_progress)
+        usn = col.usn()
+        mod = intTime()
+        col.db.executemany(
+            "update notes set flds = ?, sfld = ?, csum = ?, tags = ?,"
+            " mod = ?, usn = ? where id = ?",
+            [update + (mod, usn, nid) for nid, update in updates])
+        if updates:
+            tags = set()
+            for _, (_, _, _, note_tags) in updates:
+                tags.update(col.tags.split(note_tags))
+            col.tags.register(sorted(tags), usn=usn)
+            col.genCards([nid for nid, _ in updates])
+    finally:
+        aqt.mw.progress.finish()
+    aqt.mw.reset()
+    tooltip("ImportantWord: %s of %s note(s) changed in %.02f Sec" % (
+        len(updates), len(nids), time.time() - t0))
 
-        if 'Expression' not in note:
-            continue
 
-        if 'ImportantWord' not in note:
+def important_word_updates(col, rows, policy, progress):
+    """Return (nid, (flds, sfld, csum, tags)) of notes which change.
+
+    Like `Note.flush`: `sfld` and `csum` follow the sort and first fields.
+    """
+    table = get_prio_table()
+    mid_to_ords = {}
+    updates = []
+    for num_done, (nid, mid, flds, tags) in enumerate(rows, 1):
+        if num_done % PROGRESS_EVERY == 0:
+            progress(num_done, len(rows))
+
+        if mid not in mid_to_ords:
+            mid_to_ords[mid] = field_ords(col.models.get(mid))
+        ords = mid_to_ords[mid]
+        if not ords:
             continue
+        expression, important, sortf = ords
 
-        word = aqt.mw.col.media.strip(note['Expression'])
+        fields = splitFields(flds)
+        word = col.media.strip(fields[expression])
         if not word:
             continue
 
-        if note['ImportantWord'] not in ['', '1']:
-            continue  # manually set
+        new_flds = flds
+        if fields[important] in ['', '1']:  # Else manually set
+            fields[important] = '1' if policy.is_common(table, word) else ''
+            new_flds = joinFields(fields)
 
-        if is_common(word):
-            note['ImportantWord'] = '1'
-        else:
-            note['ImportantWord'] = ''
-        note.flush()
+        new_tags = tags
+        if policy.bands:
+            tag_list = [
+                tag for tag in col.tags.split(tags) if tag not in policy.band_tags
+            ]
+            band = policy.band(table, word)
+            if band:
+                tag_list.append(band)
+            new_tags = col.tags.join(tag_list)
+            if set(col.tags.split(new_tags)) == set(col.tags.split(tags)):
+                new_tags = tags
 
-    aqt.mw.progress.finish()
-    aqt.mw.reset()
+        if (new_flds, new_tags) == (flds, tags):
+            continue
+        sfld = stripHTMLMedia(fields[sortf])
+        csum = fieldChecksum(fields[0])
+        updates.append((nid, (new_flds, sfld, csum, new_tags)))
+    progress(len(rows), len(rows))
+    return updates
+
+
+def field_ords(model):
+    """(Expression, ImportantWord, sort field) ords, or None for other models."""
+    if not model or "japanese" not in model['name'].lower():
+        return None
+    name_to_ord = dict((fld['name'], fld['ord']) for fld in model['flds'])
+    if 'Expression' not in name_to_ord or 'ImportantWord' not in name_to_ord:
+        return None
+    return name_to_ord['Expression'], name_to_ord['ImportantWord'], model['sortf']
+
+
+def show_progress(num_done, num_total):
+    aqt.mw.progress.update(
+        label="Marking ImportantWord... %s of %s" % (num_done, num_total),
+        value=num_done)
 
 
 addHook("browser.setupMenus", add_browser_menu_entry)
@@ -3,7 +3,17 @@
 #      initialize()
 import aqt
 from anki.hooks import addHook
+from anki.utils import ids2str
+from anki.utils import split_fields
+from PyQt6 import QtCore
+from .logger import logger
 from .play_random_sentence import PlayRandomSentence
+from .voice_cache import VOICES
+
+# Lookups run here, one at a time and in order, off the UI thread: a
+# prefetch queued behind find_all_matches finds its word already looked up.
+LOOKUPS = QtCore.QThreadPool()
+LOOKUPS.setMaxThreadCount(1)
 
 
 def run(lookup):
@@ -29,9 +39,63 @@ def onJ():
     run(False)
 
 
+def in_background(fn, *args):
+    """Run `fn(*args)` in the LOOKUPS thread."""
+
+    def work():
+        try:
+            fn(*args)
+        except Exception as ex:
+            logger.exception(ex)
+
+    LOOKUPS.start(work)
+
+
+def onShowQuestion():
+    try:
+        note = aqt.mw.reviewer.card.note()
+        if 'Expression' in note:
+            in_background(PlayRandomSentence.prefetch, note['Expression'])
+    except Exception as ex:
+        logger.exception(ex)
+
+
+def due_expressions(col):
+    """Return the Expression of every due note, read in one query."""
+    nids = col.find_notes('is:due')
+    ords = {}  # mid -> ord of its Expression field, or None
+    expressions = []
+    for mid, flds in col.db.all(
+        'select mid, flds from notes where id in %s' % ids2str(nids)
+    ):
+        if mid not in ords:
+            fields = col.models.get(mid)['flds']
+            ords[mid] = next(
+                (f['ord'] for f in fields if f['name'] == 'Expression'), None
+            )
+        if ords[mid] is not None:
+            expressions.append(split_fields(flds)[ords[mid]])
+    return expressions
+
+
+def onStateChange(state, oldState):
+    """Entering review: look up all due cards at once, in the background."""
+    if state != 'review':
+        return
+    try:
+        expressions = due_expressions(aqt.mw.col)
+    except Exception as ex:
+        logger.exception(ex)
+        return
+    in_background(PlayRandomSentence.find_all_matches, expressions)
+
+
 def shortcutHook(shortcuts):
     shortcuts.append(('k', onK))
     shortcuts.append(('j', onJ))
 
 
 addHook('reviewStateShortcuts', shortcutHook)
+addHook('showQuestion', onShowQuestion)
+addHook('afterStateChange', onStateChange)
+VOICES.warm(PlayRandomSentence.SAY_VOICES)
@@ -0,0 +1,169 @@
+import hashlib
+import os
+import subprocess
+import threading
+import urllib.request
+
+from PyQt6 import QtCore
+
+from .logger import logger
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class AudioCache(object):
+    """Tatoeba recordings on disk, evicting the least recently used."""
+
+    URL = "https://audio.tatoeba.org/sentences/%s/%s.mp3"
+    TIMEOUT = 10
+    EXT = ".mp3"
+
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.in_flight = set()
+
+    def path(self, lang, sid):
+        return os.path.join(self.folder, lang, sid + self.EXT)
+
+    def get(self, *key):
+        """Return path to the cached recording, or None."""
+        path = self.path(*key)
+        try:
+            os.utime(path)  # Recently used
+        except OSError:
+            return None
+        return path
+
+    def fetch(self, *key):
+        """Download a recording (blocking); return its path, or None."""
+        path = self.get(*key)
+        if path:
+            return path
+
+        with self.lock:
+            if key in self.in_flight:
+                return None
+            self.in_flight.add(key)
+        tmp_path = None
+        try:
+            path = self.path(*key)
+            tmp_path = "%s.%s.tmp" % (path, threading.get_ident())
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            if not self.make(key, tmp_path):
+                return None
+            os.replace(tmp_path, path)
+        finally:
+            with self.lock:
+                self.in_flight.discard(key)
+            if tmp_path and os.path.isfile(tmp_path):
+                os.unlink(tmp_path)
+
+        self.evict()
+        return path
+
+    def make(self, key, path):
+        return self.download(self.URL % key, path)
+
+    def download(self, url, path):
+        if requests:
+            try:
+                r = requests.get(url, timeout=self.TIMEOUT)
+                r.raise_for_status()
+                with open(path, "wb") as fd:
+                    for chunk in r.iter_content(chunk_size=1 << 16):
+                        fd.write(chunk)
+                return True
+            except Exception as ex:
+                logger.exception(ex)
+
+        try:
+            with urllib.request.urlopen(url, timeout=self.TIMEOUT) as response:
+                with open(path, "wb") as fd:
+                    fd.write(response.read())
+            return True
+        except Exception as ex:
+            logger.exception(ex)
+            return False
+
+    def evict(self):
+        with self.lock:
+            entries = []
+            for dirpath, _, filenames in os.walk(self.folder):
+                for filename in filenames:
+                    if not filename.endswith(self.EXT):
+                        continue
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.unlink(path)
+                    total -= size
+                except OSError as ex:
+                    logger.exception(ex)
+
+
+class SpeechCache(AudioCache):
+    """Text-to-speech renderings by `say`, per (voice, text)."""
+
+    SAY = "/usr/bin/say"
+    EXT = ".m4a"
+
+    def path(self, voice, text):
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        return os.path.join(self.folder, voice, digest + self.EXT)
+
+    def make(self, key, path):
+        voice, text = key
+        cmdline = [self.SAY, "-v", voice, "-o", path]
+        cmdline += ["--file-format=m4af", "--data-format=aac", text]
+        try:
+            subprocess.run(cmdline, check=True, timeout=60)
+            return True
+        except Exception as ex:
+            logger.exception(ex)
+            return False
+
+
+class AudioFetcher(QtCore.QObject):
+    """Fetch recordings in the background; emits `fetched(*key, path)`."""
+
+    fetched = QtCore.pyqtSignal(str, str, str)
+
+    def __init__(self, cache, parent=None):
+        super(AudioFetcher, self).__init__(parent)
+        self.cache = cache
+        self.pool = QtCore.QThreadPool.globalInstance()
+
+    def prefetch(self, *key):
+        if self.cache.get(*key):
+            return
+        self.pool.start(lambda: self._fetch(*key))
+
+    def _fetch(self, *key):
+        try:
+            path = self.cache.fetch(*key)
+        except Exception as ex:
+            logger.exception(ex)
+            return
+        if path:
+            self.fetched.emit(*key, path)
+
+
+AUDIO = AudioFetcher(AudioCache(os.path.join(HERE, "audio"), 100 << 20))
+SPEECH = AudioFetcher(SpeechCache(os.path.join(HERE, "speech"), 50 << 20))
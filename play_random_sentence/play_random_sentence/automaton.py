@@ -0,0 +1,59 @@
+import collections
+
+
+class Automaton(object):
+    """Aho-Corasick: find which of many words occur in a text, in one pass.
+
+    State 0 is the root; `goto[state]` maps a character to the next
+    state, `fail[state]` is the longest proper suffix which is also a
+    state, and `out[state]` the words ending there (own and inherited).
+    """
+
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [()]
+        for word in words:
+            self.add(word)
+        self.link()
+
+    def add(self, word):
+        state = 0
+        for char in word:
+            nxt = self.goto[state].get(char)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[state][char] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(())
+            state = nxt
+        self.out[state] += (word,)
+
+    def link(self):
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, nxt in self.goto[state].items():
+                queue.append(nxt)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[nxt] = fail if fail != nxt else 0
+                self.out[nxt] += self.out[self.fail[nxt]]
+
+    def search(self, text):
+        """Return the set of words found in `text`."""
+        goto = self.goto
+        fail = self.fail
+        out = self.out
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
@@ -0,0 +1,347 @@
+import array
+import bisect
+import contextlib
+import heapq
+import math
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+
+try:
+    from .logger import logger
+except ImportError:  # Not in Anki, e.g., tatoeba/mkcorpora
+    import logging
+
+    logger = logging.getLogger(__name__)
+
+
+@contextlib.contextmanager
+def replacing(path):
+    """Write to a temporary file next to `path`, and move it there if all went well.
+
+    The name is unique, so two threads (or Ankis) building the same file
+    don't write over each other, and readers only ever see a whole file.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=os.path.basename(path) + ".", suffix=".tmp", dir=os.path.dirname(path)
+    )
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+class Corpus(object):
+    """A memory-mapped `sid[*]<TAB>text` file, with random access by line.
+
+    The start offset of each line is kept in a table next to the corpus
+    (`eng_01.txt` -> `eng_01.lines`): a header with the corpus size and
+    mtime (rebuilt when they change), then one uint32 per line (uint64
+    for corpora of 4GB and over) plus the size of the corpus.
+    """
+
+    LINES_MAGIC = b"PRSLNS01"
+    LINES_HEADER = struct.Struct("=8sQQ")  # magic, corpus mtime_ns, size
+
+    _cache = {}
+    _lock = threading.RLock()  # Held while (re)building, so that's done once
+
+    @classmethod
+    def get(cls, path):
+        """Open once per session."""
+        key = (cls, path)
+        with cls._lock:
+            if key not in cls._cache:
+                cls._cache[key] = cls(path)
+            return cls._cache[key]
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            stat = os.fstat(f.fileno())
+        self.lines_path = os.path.splitext(path)[0] + ".lines"
+        header = self.LINES_HEADER.pack(
+            self.LINES_MAGIC, stat.st_mtime_ns, stat.st_size
+        )
+        typecode = "I" if stat.st_size < (1 << 32) else "Q"
+        if not self.lines_are_fresh(header):
+            logger.info("Counting lines in %s", path)
+            self.build_lines(header, typecode)
+        with open(self.lines_path, "rb") as f:
+            self.lines = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.offsets = memoryview(self.lines)[len(header):].cast(typecode)
+
+    def lines_are_fresh(self, header):
+        try:
+            with open(self.lines_path, "rb") as f:
+                return f.read(len(header)) == header
+        except OSError:
+            return False
+
+    def build_lines(self, header, typecode):
+        offsets = array.array(typecode, [0])
+        offsets.extend(m.end() for m in re.finditer(b"\n", self.data))
+        if offsets[-1] != len(self.data):
+            offsets.append(len(self.data))
+        with replacing(self.lines_path) as f:
+            f.write(header)
+            offsets.tofile(f)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line(self, lineno):
+        """Return a line (1-based, like grep/sed), without the newline."""
+        start = self.offsets[lineno - 1]
+        end = self.offsets[lineno]
+        return self.data[start:end].decode("utf-8").rstrip("\n")
+
+    @staticmethod
+    def text(line):
+        return line.rsplit("\t", 1)[-1]
+
+
+class CorpusIndex(Corpus):
+    """An inverted index of a corpus, by characters and character pairs.
+
+    The index is saved next to the corpus (`jpn_01.txt` -> `jpn_01.idx`),
+    rebuilt if the corpus is newer, and memory-mapped. Layout (native
+    byte order): header, sorted n-gram keys (uint64), start of each key's
+    postings (uint32), postings (uint32 line numbers).
+    """
+
+    MAGIC = b"PRSIDX01"
+    HEADER = struct.Struct("=8sIIII")  # magic, n_keys, n_postings, pad, pad
+
+    def __init__(self, path):
+        super(CorpusIndex, self).__init__(path)
+        self.idx_path = os.path.splitext(path)[0] + ".idx"
+        if not self.is_fresh():
+            logger.info("Indexing %s", path)
+            self.build()
+        with open(self.idx_path, "rb") as f:
+            self.idx = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n_keys, n_postings, _, _ = self.HEADER.unpack_from(self.idx)
+        assert magic == self.MAGIC
+        view = memoryview(self.idx)
+        pos = self.HEADER.size
+        self.keys = view[pos:pos + 8 * n_keys].cast("Q")
+        pos += 8 * n_keys
+        self.starts = view[pos:pos + 4 * (n_keys + 1)].cast("I")
+        pos += 4 * (n_keys + 1)
+        self.postings = view[pos:pos + 4 * n_postings].cast("I")
+
+    def is_fresh(self):
+        try:
+            return os.path.getmtime(self.idx_path) >= os.path.getmtime(self.path)
+        except OSError:
+            return False
+
+    @staticmethod
+    def ngram_key(first, second=None):
+        """Key of a character, or a pair of them."""
+        key = ord(first) << 21
+        if second is not None:
+            key |= ord(second)
+        return key
+
+    @classmethod
+    def ngram_keys(cls, text):
+        keys = set(cls.ngram_key(char) for char in text)
+        keys.update(cls.ngram_key(a, b) for a, b in zip(text, text[1:]))
+        return keys
+
+    def build(self):
+        key_to_linenos = {}
+        for lineno in range(1, len(self) + 1):
+            for key in self.ngram_keys(self.text(self.line(lineno))):
+                key_to_linenos.setdefault(key, array.array("I")).append(lineno)
+
+        keys = array.array("Q", sorted(key_to_linenos))
+        starts = array.array("I", [0])
+        postings = array.array("I")
+        for key in keys:
+            postings.extend(key_to_linenos[key])
+            starts.append(len(postings))
+
+        with replacing(self.idx_path) as f:
+            f.write(self.HEADER.pack(self.MAGIC, len(keys), len(postings), 0, 0))
+            keys.tofile(f)
+            starts.tofile(f)
+            postings.tofile(f)
+
+    def _postings(self, key):
+        pos = bisect.bisect_left(self.keys, key)
+        if pos == len(self.keys) or self.keys[pos] != key:
+            return self.postings[0:0]
+        return self.postings[self.starts[pos]:self.starts[pos + 1]]
+
+    def search(self, expression):
+        """Return numbers of lines whose text contains `expression`."""
+        if not expression:
+            return []
+        if len(expression) == 1:
+            keys = [self.ngram_key(expression)]
+        else:
+            keys = [self.ngram_key(a, b) for a, b in zip(expression, expression[1:])]
+        postings = sorted((self._postings(key) for key in keys), key=len)
+        if len(postings) == 1:
+            return postings[0].tolist()  # Exact, no need to check
+
+        candidates = set(postings[0])
+        for more in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(more)
+        return [
+            lineno
+            for lineno in sorted(candidates)
+            if expression in self.text(self.line(lineno))
+        ]
+
+
+class SentenceScores(object):
+    """Per-line features of a Japanese corpus, and how good a pick each line is.
+
+    Saved next to the corpus (`jpn_01.txt` -> `jpn_01.scores`), rebuilt
+    when the corpus or its raters file (`jpn_01.raters`, `sid<TAB>count`
+    lines written by tatoeba/mkcorpora) change. Layout (native byte
+    order): header, then one column per feature, one entry per line:
+    length (uint16), has a recording (uint8), native raters (uint8),
+    familiarity (float32, how common its characters are in the corpus,
+    0..1) and the resulting score (float32).
+    """
+
+    MAGIC = b"PRSSCR01"
+    # magic, corpus mtime_ns, corpus size, raters mtime_ns, n_lines, max score
+    HEADER = struct.Struct("=8sQQQIf")
+    SID_RE = re.compile(r"^(\d+)([*]?)\t")
+    IDEAL_LENGTH = 25
+
+    _cache = {}
+    _lock = threading.RLock()
+
+    @classmethod
+    def get(cls, path):
+        """Open once per session."""
+        with cls._lock:
+            if path not in cls._cache:
+                cls._cache[path] = cls(CorpusIndex.get(path))
+            return cls._cache[path]
+
+    def __init__(self, index):
+        self.index = index
+        stem = os.path.splitext(index.path)[0]
+        self.scores_path = stem + ".scores"
+        self.raters_path = stem + ".raters"
+        stat = os.stat(index.path)
+        try:
+            raters_mtime = os.stat(self.raters_path).st_mtime_ns
+        except OSError:
+            raters_mtime = 0
+        fresh = (stat.st_mtime_ns, stat.st_size, raters_mtime, len(index))
+        if not self.is_fresh(fresh):
+            logger.info("Scoring %s", index.path)
+            self.build(fresh)
+
+        with open(self.scores_path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        n = len(index)
+        self.max_score = self.HEADER.unpack_from(self.data)[-1]
+        view = memoryview(self.data)
+        pos = self.HEADER.size
+        self.lengths = view[pos:pos + 2 * n].cast("H")
+        pos += self.padded(2 * n)
+        self.audio = view[pos:pos + n].cast("B")
+        pos += self.padded(n)
+        self.raters = view[pos:pos + n].cast("B")
+        pos += self.padded(n)
+        self.familiarity = view[pos:pos + 4 * n].cast("f")
+        pos += 4 * n
+        self.scores = view[pos:pos + 4 * n].cast("f")
+
+    @staticmethod
+    def padded(size):
+        return size + -size % 4
+
+    def is_fresh(self, fresh):
+        try:
+            with open(self.scores_path, "rb") as f:
+                header = f.read(self.HEADER.size)
+            magic, *got, _ = self.HEADER.unpack(header)
+        except (OSError, struct.error):
+            return False
+        return magic == self.MAGIC and tuple(got) == fresh
+
+    def read_raters(self):
+        raters = {}
+        try:
+            with open(self.raters_path) as f:
+                for line in f:
+                    sid, count = line.split("\t")
+                    raters[sid] = int(count)
+        except OSError:
+            pass
+        return raters
+
+    @classmethod
+    def score(cls, length, audio, raters, familiarity):
+        """Short, recorded, rated, common sentences first."""
+        score = 1.0 if length <= cls.IDEAL_LENGTH else cls.IDEAL_LENGTH / length
+        if audio:
+            score *= 2
+        score *= 1 + math.log1p(raters)
+        score *= 0.5 + familiarity
+        return score
+
+    def build(self, fresh):
+        index = self.index
+        n = len(index)
+        sid_to_raters = self.read_raters()
+        lengths = array.array("H")
+        audio = array.array("B")
+        raters = array.array("B")
+        familiarity = array.array("f")
+        scores = array.array("f")
+
+        # log(lines with a character) / log(lines), per character
+        scale = math.log1p(n)
+        char_familiarity = {}
+        for lineno in range(1, n + 1):
+            line = index.line(lineno)
+            text = index.text(line)
+            m = self.SID_RE.match(line)
+            sid, mp3 = m.groups() if m else (None, "")
+            fam = 0.0
+            for char in text:
+                if char not in char_familiarity:
+                    count = len(index._postings(index.ngram_key(char)))
+                    char_familiarity[char] = math.log1p(count) / scale
+                fam += char_familiarity[char]
+            fam = fam / len(text) if text else 0.0
+
+            lengths.append(min(len(text), 0xFFFF))
+            audio.append(1 if mp3 else 0)
+            raters.append(min(sid_to_raters.get(sid, 0), 0xFF))
+            familiarity.append(fam)
+            scores.append(self.score(lengths[-1], audio[-1], raters[-1], fam))
+
+        with replacing(self.scores_path) as f:
+            f.write(self.HEADER.pack(self.MAGIC, *fresh, max(scores, default=0.0)))
+            for column in (lengths, audio, raters):
+                f.write(column.tobytes())
+                f.write(bytes(-len(column) * column.itemsize % 4))
+            familiarity.tofile(f)
+            scores.tofile(f)
+
+    def top(self, expression, k):
+        """Return the best `k` (score, lineno) of lines containing `expression`."""
+        linenos = self.index.search(expression)
+        return heapq.nlargest(k, ((self.scores[n - 1], n) for n in linenos))
@@ -1,27 +1,25 @@
+import heapq
 import os
 import random
-import subprocess
 import itertools
-from functools import partial
 
+from .audio_cache import AUDIO
+from .audio_cache import SPEECH
+from .audio_cache import SpeechCache
+from .automaton import Automaton
+from .corpus_index import Corpus
+from .corpus_index import CorpusIndex
+from .corpus_index import SentenceScores
 from .logger import logger
+from .player import Player
+from .player import Track
+from .voice_cache import VOICES
 
 try:
     import regex as re
 except ImportError:
     import re
 
-try:
-    import urllib2
-except ImportError:
-    urllib2 = None
-
-try:
-    import requests
-except ImportError:
-    requests = None
-
-from PyQt6 import QtCore
 from PyQt6 import QtGui
 from PyQt6 import QtWidgets
 
@@ -33,9 +31,14 @@ def corpus_fn(lang, corpus_no):
     return os.path.join(HERE, "%s_%02d.txt" % (lang, corpus_no))
 
 
-def run(*args):
-    output = subprocess.check_output(args)
-    return output.decode("utf-8")
+def corpus_nos():
+    """Return the numbers of the corpora there are: jpn_01.txt, jpn_02.txt, ..."""
+    return list(
+        itertools.takewhile(
+            lambda corpus_no: os.path.isfile(corpus_fn("jpn", corpus_no)),
+            itertools.count(1),
+        )
+    )
 
 
 class Side(object):
@@ -48,6 +51,7 @@ class Side(object):
         self.text = None
         self.sid = None
         self.index = None
+        self.label = None
 
     def humanize_font(self):
         if not self.human:
@@ -71,30 +75,23 @@ class Side(object):
 
 
 class JpnMatch(object):
-    def __init__(self, corpus_no, line):
+    def __init__(self, corpus_no, lineno):
         self.corpus_no = corpus_no
+        line = CorpusIndex.get(corpus_fn("jpn", corpus_no)).line(lineno)
         self.fields = re.match(
             r"^"
-            r"(?P<lineno>\d+):"
             r"((?P<sid>\d+)(?P<mp3>[*]?)\t)?"
             r"(?P<text>[^\t]+)"
             r"$",
             line.strip(),
         ).groupdict()
+        self.fields["lineno"] = lineno
 
 
 class EngMatch(object):
     def __init__(self, jpn_match):
-        sed_bin = next(
-            path
-            for path in ["/usr/local/bin/gsed", "/usr/bin/sed"]
-            if os.path.exists(path)
-        )
-        line = run(
-            sed_bin,
-            "%sq;d" % jpn_match.fields["lineno"],
-            corpus_fn("eng", jpn_match.corpus_no),
-        )
+        corpus = Corpus.get(corpus_fn("eng", jpn_match.corpus_no))
+        line = corpus.line(jpn_match.fields["lineno"])
 
         self.fields = re.match(
             r"^" r"((?P<sid>\d+)(?P<mp3>[*]?)\t)?" r"(?P<text>[^\t]+)", line.strip()
@@ -106,16 +103,18 @@ class PlayRandomSentence(QtWidgets.QDialog):
     ENG_VOICES = []
     HEB_VOICES = []
     BLACKLIST = ["Fred", "Kathy", "Vicki", "Victoria"]
+    SAY_VOICES = ("say", "-v", "?")
+    PREFETCH_LIMIT = 4
+    PRERENDER_LIMIT = 2
+    TOP_K = 50
+    TIER_WEIGHT = 0.5  # Each corpus is this much less attractive than the last
+    MATCHES = {}  # word -> find_matches(word)
 
     def __init__(self, parent=None, expression=None, meaning=None, lookup=True):
         super(PlayRandomSentence, self).__init__(parent)
-        self.grep_bin = next(
-            path
-            for path in ["/usr/local/bin/rg", "/usr/bin/grep"]
-            if os.path.exists(path)
-        )
         self.get_voices()
-        self.saying = None
+        self.player = Player(self)
+        self.ans_shown = False
         self.jpn = Side("jpn", self.JPN_VOICES)
         self.eng = Side("eng", self.ENG_VOICES)
         self.heb = Side("heb", self.HEB_VOICES)
@@ -148,7 +147,7 @@ class PlayRandomSentence(QtWidgets.QDialog):
     @classmethod
     def get_lang_voices_with_voices(cls, lang):
         try:
-            output = run("/usr/local/bin/voices", "-l", lang)
+            output = VOICES.output("/usr/local/bin/voices", "-l", lang)
             return [line.split(" ", 1)[0] for line in output.split("\n") if " " in line]
         except Exception:
             return []
@@ -156,7 +155,7 @@ class PlayRandomSentence(QtWidgets.QDialog):
     @classmethod
     def get_lang_voices_with_say(cls, look_for):
         try:
-            output = run("say", "-v", "?")
+            output = VOICES.output(*cls.SAY_VOICES)
             return [
                 line.split(" ", 1)[0]
                 for line in output.split("\n")
@@ -187,7 +186,8 @@ class PlayRandomSentence(QtWidgets.QDialog):
         button.clicked.connect(self.next_clicked)
         button.setFocus()
 
-        self.finished.connect(self.shut_up)
+        self.finished.connect(self.player.stop)
+        self.finished.connect(self.forget_audio)
 
         self.actions = [self.play_jpn]
         if self.both:
@@ -210,6 +210,7 @@ class PlayRandomSentence(QtWidgets.QDialog):
         label = QtWidgets.QLabel(side.text)
         label.setFont(side.font)
         label.setWordWrap(True)
+        side.label = label
         return label
 
     def get_word(self, expression, meaning):
@@ -217,23 +218,95 @@ class PlayRandomSentence(QtWidgets.QDialog):
         self.meaning = self.strip(meaning)
         self.both = self.word and self.meaning
 
-    def strip(self, s):
+    @staticmethod
+    def strip(s):
         if not s:
             return s
         return re.sub(r"<.*?>", r"", s)
 
     def look_it_up(self):
-        self.jpn_matches = []
-        for corpus_no in range(1, 5):
-            if self.try_corpus(corpus_no):
-                if len(self.jpn_matches) > 1:
-                    break
-
+        self.jpn_matches = self.find_matches(self.word)
         if self.jpn_matches:
-            return self.found_pair(random.choice(self.jpn_matches))
+            weights = [score for score, _, _ in self.jpn_matches]
+            _, corpus_no, lineno = random.choices(self.jpn_matches, weights)[0]
+            return self.found_pair(JpnMatch(corpus_no, lineno))
         else:
             return self.found_nothing()
 
+    @classmethod
+    def find_matches(cls, word):
+        """Return the best (score, corpus_no, lineno) for `word`, best first."""
+        if word in cls.MATCHES:
+            return cls.MATCHES[word]
+        matches = []
+        weight = 1.0
+        for corpus_no in corpus_nos():
+            cls.try_corpus(word, corpus_no, weight, matches)
+            weight *= cls.TIER_WEIGHT
+        cls.MATCHES[word] = matches
+        return matches
+
+    @classmethod
+    def find_all_matches(cls, expressions):
+        """Look up many expressions at once, for `find_matches` to remember.
+
+        Each corpus is read once, whatever the number of words.
+        """
+        words = set(filter(None, map(cls.strip, expressions))) - set(cls.MATCHES)
+        if not words:
+            return
+        automaton = Automaton(words)
+        best = dict((word, []) for word in words)  # Min-heaps of TOP_K
+        for corpus_no in corpus_nos():
+            tier_weight = cls.TIER_WEIGHT ** (corpus_no - 1)
+            try:
+                scores = SentenceScores.get(corpus_fn("jpn", corpus_no))
+            except Exception as ex:
+                logger.exception(ex)
+                continue
+            index = scores.index
+            lines = index.data[:].decode("utf-8").split("\n")
+            for lineno in range(1, len(index) + 1):
+                for word in automaton.search(index.text(lines[lineno - 1])):
+                    match = (scores.scores[lineno - 1] * tier_weight, corpus_no, lineno)
+                    if len(best[word]) < cls.TOP_K:
+                        heapq.heappush(best[word], match)
+                    else:
+                        heapq.heappushpop(best[word], match)
+        cls.MATCHES.update(
+            (word, sorted(matches, reverse=True)) for word, matches in best.items()
+        )
+
+    @classmethod
+    def prefetch(cls, expression):
+        """Start fetching recordings of sentences we may pick for `expression`."""
+        num_prefetched = 0
+        to_render = []
+        for _, corpus_no, lineno in cls.find_matches(cls.strip(expression)):
+            scores = SentenceScores.get(corpus_fn("jpn", corpus_no))
+            fields = JpnMatch(corpus_no, lineno).fields
+            if not scores.audio[lineno - 1]:
+                if len(to_render) < cls.PRERENDER_LIMIT:
+                    to_render.append(fields["text"])
+            elif num_prefetched < cls.PREFETCH_LIMIT:
+                AUDIO.prefetch("jpn", fields["sid"])
+                num_prefetched += 1
+            if (num_prefetched, len(to_render)) == (
+                cls.PREFETCH_LIMIT,
+                cls.PRERENDER_LIMIT,
+            ):
+                break
+        if to_render:
+            SPEECH.pool.start(lambda: cls.prerender(to_render))
+
+    @classmethod
+    def prerender(cls, texts):
+        """Have `say` render `texts`, with every Japanese voice (in a thread)."""
+        cls.get_voices()
+        for text in texts:
+            for voice in cls.JPN_VOICES:
+                SPEECH.prefetch(voice, text)
+
     def found_nothing(self):
         self.jpn.text = self.word
         if self.meaning and re.search(r"[\u05D0-\u05EA]", self.meaning):
@@ -247,95 +320,50 @@ class PlayRandomSentence(QtWidgets.QDialog):
         eng_match = EngMatch(jpn_match)
         self.jpn.from_match(jpn_match.fields)
         self.eng.from_match(eng_match.fields)
-        self.jpn.mp3 = self.try_human(self.jpn)
-        # self.eng.mp3 = self.try_human(self.eng)
+        self.jpn.mp3 = self.want_human(self.jpn)
+        # self.eng.mp3 = self.want_human(self.eng)
         self.ans = self.eng
 
-    def try_human(self, side):
+    def want_human(self, side):
         if not side.human:
             return None
-
-        fn = "%s.mp3" % side.sid
-        path = os.path.join(HERE, fn)
-        url = "https://audio.tatoeba.org/sentences/%s/%s" % (side.lang, fn)
-
-        places = [
-            partial(os.path.isfile, path),
-            partial(self.try_requests, url, path),
-            partial(self.try_wget, url),
-            partial(self.try_urllib2, url, path),
-        ]
-
-        if any(func() for func in places):
-            return path
-
-        if os.path.isfile(path):
-            os.unlink(path)
-        return None
-
-    def try_requests(self, url, path):
-        if not requests:
-            return False
-
-        try:
-            r = requests.get(url, timeout=2)
-            r.raise_for_status()
-            with open(path, "wb") as fd:
-                for chunk in r.iter_content(chunk_size=1024):
-                    fd.write(chunk)
-            return True
-        except Exception as ex:
-            logger.exception(ex)
-            return False
-
-    def try_wget(self, url):
-        try:
-            run("/usr/local/bin/wget", "--timeout=3", url, "-P", HERE)
-            return True
-        except Exception as ex:
-            logger.exception(ex)
-            return False
-
-    def try_urllib2(self, url, path):
-        if not urllib2:
-            return False
-
+        path = AUDIO.cache.get(side.lang, side.sid)
+        if not path:
+            AUDIO.fetched.connect(self.fetched)
+            AUDIO.prefetch(side.lang, side.sid)
+        return path
+
+    def fetched(self, lang, sid, path):
+        for side in (self.jpn, self.ans):
+            if not side.human or side.mp3 or (side.lang, side.sid) != (lang, sid):
+                continue
+            side.mp3 = path
+            side.font.setItalic(False)
+            side.humanize_font()
+            if side.label:
+                side.label.setFont(side.font)
+
+    def forget_audio(self, *args):
         try:
-            response = urllib2.urlopen(url, timeout=2)
-        except urllib2.URLError as ex:
-            logger.exception(ex)
-            return False
-        if not response:
-            logger.info("No response from %s", url)
-            return False
-        if response.getcode() != 200:
-            logger.info("%s => HTTP %s", url, response.getcode())
-            response.close()
-            return False
-
-        with open(path, "wb") as f:
-            f.write(response.read())
-        response.close()
-        return True
+            AUDIO.fetched.disconnect(self.fetched)
+        except TypeError:
+            pass
 
     def next_clicked(self):
         self.play_next()
 
     def play_next(self):
-        self.shut_up()
         callback = next(self.curr)
         callback()
 
     def play_jpn(self):
-        if self.jpn.human and self.jpn.mp3:
-            return self.play(self.jpn.mp3)
-        self.say(self.jpn)
+        tracks = [self.track(self.jpn)]
+        if self.ans_shown:
+            tracks.append(self.track(self.ans))  # Nothing to hide, so back to back
+        self.player.play(*tracks)
 
     def play_ans(self):
-        self.show_ans()
-        if self.ans.human and self.ans.mp3:
-            return self.play(self.ans.mp3)
-        self.say(self.ans)
+        self.player.play(self.track(self.ans, self.show_ans))
 
     def hide_ans(self):
         p = self.ans_label.palette()
@@ -348,42 +376,48 @@ class PlayRandomSentence(QtWidgets.QDialog):
         p = self.ans_label.palette()
         p.setColor(self.ans_label.foregroundRole(), self.ans_foreground)
         self.ans_label.setPalette(p)
+        if not self.ans_shown:
+            self.ans_shown = True
+            self.curr = itertools.cycle([self.play_jpn])
 
-    def try_corpus(self, corpus_no):
+    @classmethod
+    def try_corpus(cls, word, corpus_no, weight, matches):
+        """Merge this corpus' best matches into the TOP_K best `matches`."""
         try:
-            output = run(self.grep_bin, "-n", self.word, corpus_fn("jpn", corpus_no))
-
-            matches = [JpnMatch(corpus_no, line) for line in output.split("\n") if line]
-            if not matches:
+            scores = SentenceScores.get(corpus_fn("jpn", corpus_no))
+            best = scores.max_score * weight
+            if len(matches) == cls.TOP_K and matches[-1][0] >= best:
+                return False  # Nothing in here can make the cut
+            top = scores.top(word, cls.TOP_K)
+            if not top:
                 return False
-            self.jpn_matches.extend(matches)
+            matches.extend((score * weight, corpus_no, n) for score, n in top)
+            matches.sort(reverse=True)
+            del matches[cls.TOP_K:]
             return True
         except Exception as ex:
             logger.exception(ex)
             return False
 
-    def say(self, side):
-        self._say("/usr/bin/say", "-v", side.next_voice(), side.text)
-
-    def play(self, path):
-        self._say("/usr/local/bin/play", path)
-
-    def _say(self, executable, *args):
-        self.saying = QtCore.QProcess(self)
-        self.saying.finished.connect(self.said)
-        self.saying.start(executable, args)
-        self.saying.waitForStarted()
-
-    def said(self, *args):
-        self.saying = None
+    def track(self, side, on_start=None):
+        """How to hear a side: its recording, a rendering, or `say` itself."""
+        if side.human and side.mp3:
+            return self.play(side.mp3, on_start)
+        voice = side.next_voice()
+        path = SPEECH.cache.get(voice, side.text)
+        if path:
+            return self.play(path, on_start)
+        SPEECH.prefetch(voice, side.text)  # For next time
+        return Track(SpeechCache.SAY, ["-v", voice, side.text], on_start)
 
-    def shut_up(self, *args, **kwargs):
-        if self.saying:
-            self.saying.kill()
-            self.saying.waitForFinished()
+    @staticmethod
+    def play(path, on_start=None):
+        if path.endswith(SpeechCache.EXT):
+            return Track("/usr/bin/afplay", [path], on_start)  # SoX can't read AAC
+        return Track("/usr/local/bin/play", [path], on_start)
 
 
 # TODO: cycle defs
-# TODO: Utility to produce sentnces_*.txt (incl. download etc.)
+# TODO: Download the Tatoeba exports (see tatoeba/sqlify, tatoeba/mkcorpora)
 # TODO: TTS using awesometts (w/ voices and groups)
 # TODO: Play using Anki/awesometts
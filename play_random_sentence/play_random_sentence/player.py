@@ -0,0 +1,83 @@
+import collections
+
+from PyQt6 import QtCore
+
+from .logger import logger
+
+
+class Track(object):
+    """A command which plays something, and what to do when it starts."""
+
+    def __init__(self, executable, args, on_start=None):
+        self.executable = executable
+        self.args = list(args)
+        self.on_start = on_start
+
+
+class Player(QtCore.QObject):
+    """Play tracks one after the other, without ever waiting on a process.
+
+    Idle (no process), playing (`process`), or stopping (`process` was
+    killed, and we wait for its `finished` before starting the next
+    track). Whatever `play` or `enqueue` asks for starts from the
+    `finished` of the previous track, so a queue plays back to back,
+    but not gaplessly: each track is a process of its own (recordings,
+    renderings and `say` need different programs), and the next one
+    starts up only then.
+    """
+
+    def __init__(self, parent=None):
+        super(Player, self).__init__(parent)
+        self.process = None
+        self.stopping = False
+        self.queue = collections.deque()
+
+    def play(self, *tracks):
+        """Stop what's playing, and what's queued; then play `tracks`."""
+        self.queue.clear()
+        self.queue.extend(tracks)
+        if self.process is None:
+            self.start_next()
+        else:
+            self.kill()
+
+    def enqueue(self, *tracks):
+        self.queue.extend(tracks)
+        if self.process is None:
+            self.start_next()
+
+    def stop(self, *args):
+        self.queue.clear()
+        self.kill()
+
+    def kill(self):
+        if self.process is not None and not self.stopping:
+            self.stopping = True
+            self.process.kill()
+
+    def start_next(self):
+        if not self.queue:
+            return
+        track = self.queue.popleft()
+        if track.on_start:
+            track.on_start()
+
+        process = QtCore.QProcess(self)
+        process.finished.connect(lambda *args: self.finished(process))
+        process.errorOccurred.connect(lambda error: self.failed(process, error))
+        self.process = process
+        self.stopping = False
+        process.start(track.executable, track.args)
+
+    def finished(self, process):
+        if process is not self.process:
+            return
+        self.process = None
+        self.stopping = False
+        process.deleteLater()
+        self.start_next()
+
+    def failed(self, process, error):
+        if error == QtCore.QProcess.ProcessError.FailedToStart:
+            logger.info("Cannot start %s", process.program())
+            self.finished(process)  # No `finished` coming
@@ -0,0 +1,97 @@
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from .logger import logger
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+class VoiceCache(object):
+    """Output of voice-listing commands (`say -v ?`...), kept across sessions.
+
+    An entry is good for `ttl` seconds, and only while the command's
+    executable is unchanged (installing voices, or a new `say`, updates
+    it). The lock is held while a command runs, so whoever asks while
+    `warm` is at it waits for its result instead of running it again.
+    """
+
+    TTL = 7 * 24 * 3600
+
+    def __init__(self, path, ttl=TTL):
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.entries = None
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save(self):
+        tmp_path = "%s.%s.tmp" % (self.path, threading.get_ident())
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def stamp(executable):
+        path = shutil.which(executable)
+        if not path:
+            return None
+        return os.stat(path).st_mtime_ns
+
+    def output(self, *args):
+        """Return the output of running `args`, from the cache if still valid."""
+        key = " ".join(args)
+        stamp = self.stamp(args[0])
+        with self.lock:
+            if self.entries is None:
+                self.entries = self.load()
+            entry = self.entries.get(key)
+            if (
+                entry
+                and entry["stamp"] == stamp
+                and time.time() - entry["time"] < self.ttl
+            ):
+                return entry["output"]
+
+            output = subprocess.check_output(args).decode("utf-8")
+            self.entries[key] = {"stamp": stamp, "time": time.time(), "output": output}
+            try:
+                self.save()
+            except OSError as ex:
+                logger.exception(ex)
+            return output
+
+    def invalidate(self):
+        with self.lock:
+            self.entries = {}
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+
+    def warm(self, *cmdlines):
+        """Load the cache, and refresh stale entries, in the background."""
+
+        def work():
+            for args in cmdlines:
+                try:
+                    self.output(*args)
+                except Exception as ex:
+                    logger.exception(ex)
+
+        thread = threading.Thread(target=work, name="VoiceCache.warm", daemon=True)
+        thread.start()
+        return thread
+
+
+VOICES = VoiceCache(os.path.join(HERE, "voices.json"))
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import sys
 import sqlalchemy as sa
 import sqlalchemy.orm
 import sqlalchemy.ext.declarative
@@ -8,10 +9,41 @@ LANGUAGES = ('jpn', 'eng')
 Base = sqlalchemy.ext.declarative.declarative_base()
 
 
+class SidSet(object):
+    """A set of sentence ids (as found in the CSVs): one bit per id.
+
+    Ids are dense, so this is a few MB, rather than a few hundred MB of
+    strings in a `set`. Ids above MAX_SID are refused, as one bogus huge
+    id would otherwise grow it to match.
+    """
+
+    MAX_SID = (1 << 27) - 1  # 16 MB of bits; Tatoeba is at ~13M sentences
+
+    def __init__(self):
+        self.bits = bytearray()
+
+    def add(self, sid):
+        sid = int(sid)
+        if not 0 <= sid <= self.MAX_SID:
+            raise ValueError('Sentence id out of range: %d' % sid)
+        byte = sid >> 3
+        if byte >= len(self.bits):
+            self.bits.extend(bytes(max(byte + 1, 2 * len(self.bits)) - len(self.bits)))
+        self.bits[byte] |= 1 << (sid & 7)
+
+    def __contains__(self, sid):
+        try:
+            sid = int(sid)
+        except ValueError:
+            return False
+        byte = sid >> 3
+        return 0 <= byte < len(self.bits) and bool(self.bits[byte] & (1 << (sid & 7)))
+
+
 class UserLanguage(Base):
     __tablename__ = 'user_languages'
     _FIELDS = ('lang', 'skill_level', 'username', 'details')
-    _NATIVES = set()
+    _NATIVES = set()  # Interned
     username = sa.Column(sa.String(256), primary_key=True)
     lang = sa.Column(sa.String(256), primary_key=True)
     skill_level = sa.Column(sa.Integer)
@@ -23,14 +55,14 @@ class UserLanguage(Base):
             return False
         if row['lang'] not in LANGUAGES:
             return False
-        UserLanguage._NATIVES.add(row['username'])
+        UserLanguage._NATIVES.add(sys.intern(row['username']))
         return True
 
 
 class Sentence(Base):
     __tablename__ = 'sentences_detailed'
     _FIELDS = ('sid', 'lang', 'text', 'username', 'date_added', 'date_modified')
-    _SIDS = set()
+    _SIDS = SidSet()
 
     sid = sa.Column(sa.Integer, primary_key=True)
     lang = sa.Column(sa.String(8), nullable=False)
@@ -110,7 +142,7 @@ class Link(Base):
 class SentenceAudio(Base):
     __tablename__ = 'sentences_with_audio'
     _FIELDS = ('sid', 'username', 'license', 'url')
-    _SIDS = set()
+    _SIDS = SidSet()
     sid = sa.Column(sa.Integer, sa.ForeignKey(Sentence.sid), primary_key=True)
     username = sa.Column(sa.String(256))
     license = sa.Column(sa.String(256))